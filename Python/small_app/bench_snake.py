@@ -0,0 +1,362 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import deque
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+from snake_engine import SnakeEngine, SNAKE
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Every result is {"value", "unit", "better"}, better is "higher" or "lower"
+def result(value, unit, better):
+    return {"value": value, "unit": unit, "better": better}
+
+# Seconds per call of fn, the best of several rounds that together take
+# about `seconds`. The best round is the one least disturbed by the rest of
+# the machine, which keeps --compare from flagging noise.
+def timed(fn, seconds=0.5, rounds=5):
+    best = None
+    for _ in range(rounds):
+        calls = 0
+        start = time.perf_counter()
+        while True:
+            fn()
+            calls += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= seconds / rounds:
+                break
+        if best is None or elapsed / calls < best:
+            best = elapsed / calls
+    return best
+
+# Hamiltonian cycle: rows zigzag over columns 1.. and column 0 leads back up
+def serpentine_cycle(cols, rows):
+    path = []
+    for y in range(rows):
+        xs = range(1, cols) if y % 2 == 0 else range(cols - 1, 0, -1)
+        path += [(x, y) for x in xs]
+    path += [(0, y) for y in range(rows - 1, -1, -1)]
+    return path
+
+# An engine whose snake already has `length` cells laid along the cycle, so
+# following the cycle never collides
+def long_snake_engine(length, cols, rows):
+    engine = SnakeEngine(cols, rows)
+    engine.reset(seed=1)
+    for x, y in engine.snake:
+        engine.release(y * cols + x)
+    engine.release(engine.food[1] * cols + engine.food[0])
+
+    path = serpentine_cycle(cols, rows)
+    engine.snake = deque(reversed(path[:length]))
+    for x, y in engine.snake:
+        engine.occupy(y * cols + x, SNAKE)
+    engine.direction = (path[length][0] - path[length - 1][0], path[length][1] - path[length - 1][1])
+    engine.food = engine.generate_food()
+    return engine, path
+
+def cycle_follower(engine, path):
+    position = {cell: i for i, cell in enumerate(path)}
+    def action():
+        head = engine.snake[0]
+        nxt = path[(position[head] + 1) % len(path)]
+        return (nxt[0] - head[0], nxt[1] - head[1])
+    return action
+
+def bench_engine(results, quick):
+    lengths = [3, 100, 1000] if quick else [3, 100, 1000, 5000]
+    for length in lengths:
+        # Big enough board that the snake fills at most a quarter of it
+        side = max(50, int((length * 4) ** 0.5) + 2) // 2 * 2
+        engine, path = long_snake_engine(length, side, side)
+        action = cycle_follower(engine, path)
+        start_length = len(engine.snake)
+
+        def run():
+            for _ in range(1000):
+                engine.step(action())
+        results[f"engine.step.length_{length}"] = result(1000 / timed(run), "ticks/s", "higher")
+        assert not engine.game_over and len(engine.snake) >= start_length
+
+# What search pays per node: copying a game, or trying moves and taking
+# them back, and what handing a game to another process costs
+def bench_state(results, quick):
+    for length in (3, 1000):
+        engine, path = long_snake_engine(length, 50, 50)
+        action = cycle_follower(engine, path)
+        results[f"state.clone.length_{length}"] = result(timed(engine.clone, 0.3) * 1e6, "us", "lower")
+
+        def lookahead():
+            token = engine.snapshot()
+            for _ in range(10):
+                engine.step(action())
+            engine.restore(token)
+        results[f"state.snapshot_10_steps.length_{length}"] = result(timed(lookahead, 0.3) * 1e6, "us", "lower")
+        engine.discard_snapshots()
+
+        data = engine.to_bytes()
+        results[f"state.to_bytes.length_{length}"] = result(timed(engine.to_bytes, 0.3) * 1e6, "us", "lower")
+        results[f"state.from_bytes.length_{length}"] = result(
+            timed(lambda: SnakeEngine.from_bytes(data), 0.3) * 1e6, "us", "lower")
+        results[f"state.bytes.length_{length}"] = result(len(data), "bytes", "lower")
+
+def bench_food(results, quick):
+    rng = random.Random(1)
+    for fill in (0.10, 0.50, 0.90, 0.99):
+        engine = SnakeEngine()
+        engine.reset(seed=1)
+        cells = list(engine.free.cells)
+        rng.shuffle(cells)
+        for index in cells[:int(len(engine.grid) * fill) - len(engine.snake) - 1]:
+            engine.occupy(index, SNAKE)
+
+        def run():
+            for _ in range(100):
+                x, y = engine.generate_food()
+                engine.release(y * engine.cols + x)
+        results[f"generate_food.fill_{int(fill * 100)}"] = result(timed(run, 0.3) / 100 * 1e6, "us", "lower")
+
+# One arena tick, moves decided beforehand, against the number of snakes
+def bench_arena(results, quick):
+    from snake_arena import ArenaEngine
+    from snake_rollout import greedy_policy
+    for count in (50, 500) if quick else (50, 100, 250, 500):
+        side = max(100, int((count * 80) ** 0.5))
+        arena = ArenaEngine(side, side, food_count=count, obstacle_count=side * side // 200, seed=1)
+        for _ in range(count):
+            arena.add_snake(greedy_policy)
+
+        def tick():
+            arena.step(arena.decide())
+        results[f"arena.tick.snakes_{count}"] = result(timed(tick, 0.3) * 1000, "ms", "lower")
+
+# Observations per second for learning pipelines: grid tensors from single
+# engines and from a whole SnakeVecEnv, and small RGB frames
+def bench_observe(results, quick):
+    from snake_observe import grid_buffer, observe_engines, observe_vec_env, FrameRenderer
+    from snake_vec_env import SnakeVecEnv
+    batch = 64
+    engines = []
+    for seed in range(batch):
+        engine = SnakeEngine()
+        engine.reset("Hard", seed=seed)
+        engines.append(engine)
+
+    grid = grid_buffer(batch)
+    results["observe.grid.engine"] = result(batch / timed(lambda: observe_engines(engines, grid)), "obs/s", "higher")
+
+    env = SnakeVecEnv(1024, "Hard")
+    env.reset(1)
+    vec_grid = grid_buffer(env.num_envs)
+    results["observe.grid.vec_env"] = result(env.num_envs / timed(lambda: observe_vec_env(env, vec_grid)),
+                                             "obs/s", "higher")
+
+    renderer = FrameRenderer(cell_pixels=4)
+    frames = renderer.buffer(batch)
+    results["observe.rgb.cell_4"] = result(batch / timed(lambda: renderer.render_batch(engines, frames)),
+                                           "obs/s", "higher")
+
+def bench_render(results, quick):
+    import pygame
+    import code08
+    game = code08.SnakeGame()
+    frame = lambda fn: timed(fn) * 1000
+
+    # A long snake in the middle of a classic game
+    engine, path = long_snake_engine(1000, game.engine.cols, game.engine.rows)
+    action = cycle_follower(engine, path)
+    game.engine = engine
+    game.in_menu = False
+    game.game_started = True
+    game.difficulty = "Easy"
+    game.start_time = time.time()
+
+    # draw_game paints the background itself, from the board layer
+    def full():
+        game.draw_game()
+        pygame.display.flip()
+    results["render.draw_game.full"] = result(frame(full), "ms", "lower")
+
+    def play():
+        game.direction = action()
+        game.move_snake()
+        game.draw()
+    game.draw()
+    results["render.draw.playing"] = result(frame(play), "ms", "lower")
+
+    game.pause_game()
+    results["render.draw.paused"] = result(frame(game.draw), "ms", "lower")
+    game.unpause_game()
+    game.game_over = True
+    game.end_time = time.time()
+    results["render.draw.game_over"] = result(frame(game.draw), "ms", "lower")
+    game.game_over = False
+
+    game.in_menu = True
+    results["render.draw.menu"] = result(frame(game.draw), "ms", "lower")
+
+    for i in range(1000 if quick else 10000):
+        game.history_store.add({"mode": "Classic", "start_time": "2025-04-30 10:00:00",
+                                "end_time": "2025-04-30 10:01:00", "duration": 60.0,
+                                "difficulty": "Easy", "speed": 5, "score": i})
+    game.in_menu = False
+    game.in_history = True
+    game.history_view.refresh()
+    results["render.draw_history.static"] = result(frame(game.draw), "ms", "lower")
+
+    def scroll():
+        game.history_view.scroll_rows(game.history_view.VISIBLE_ROWS)
+        game.draw()
+    results["render.draw_history.paging"] = result(frame(scroll), "ms", "lower")
+    game.history_store.close()
+
+def bench_history(results, quick):
+    from snake_history import HistoryStore
+    sizes = [100, 10000] if quick else [100, 10000, 1000000]
+    entry = {"mode": "Classic", "start_time": "2025-04-30 10:00:00", "end_time": "2025-04-30 10:01:00",
+             "duration": 60.0, "difficulty": "Easy", "speed": 5, "score": 1}
+    for size in sizes:
+        path = os.path.join(os.getcwd(), f"history_{size}.db")
+        store = HistoryStore(path)
+        start = time.perf_counter()
+        for i in range(size):
+            store.add(entry)
+        store.flush()
+        elapsed = time.perf_counter() - start
+        results[f"history.save.{size}"] = result(elapsed / size * 1e6, "us/entry", "lower")
+
+        # What a game over costs the game loop: queueing one entry
+        results[f"history.add_one.{size}"] = result(timed(lambda: store.add(entry), 0.2) * 1e6, "us", "lower")
+        store.flush()
+        store.close()
+
+        # What opening the history screen costs: open, count, first page
+        def load():
+            reopened = HistoryStore(path)
+            reopened.count()
+            reopened.page(0, 64)
+            reopened.close()
+        results[f"history.load.{size}"] = result(timed(load, 0.3) * 1000, "ms", "lower")
+
+        # What opening the stats screen queries
+        stats_store = HistoryStore(path)
+        def stats():
+            for bracket in stats_store.brackets()[:8]:
+                stats_store.duration_percentiles(bracket["mode"], bracket["difficulty"], bracket["speed"])
+            stats_store.leaderboard("Classic", "Easy", 5)
+            stats_store.days()
+        results[f"history.stats.{size}"] = result(timed(stats, 0.3) * 1000, "ms", "lower")
+        stats_store.close()
+
+# Launch to the first menu frame in a fresh interpreter, and how much of
+# that is spent importing and in SnakeGame()
+def bench_startup(results, quick):
+    script = ("import time\n"
+              "start = time.time()\n"
+              "import code08\n"
+              "imported = time.time()\n"
+              "game = code08.SnakeGame()\n"
+              "created = time.time()\n"
+              "game.draw()\n"
+              "print(start, imported, created, time.time())\n"
+              "game.history_store.close()\n")
+    env = dict(os.environ, PYTHONPATH=HERE + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    samples = []
+    for _ in range(3 if quick else 7):
+        launched = time.time()
+        out = subprocess.run([sys.executable, "-c", script], env=env, cwd=os.getcwd(),
+                             capture_output=True, text=True, check=True).stdout
+        start, imported, created, drawn = (float(t) for t in out.strip().splitlines()[-1].split())
+        samples.append((drawn - launched, imported - start, created - imported))
+    samples.sort()
+    first_frame, imports, game = samples[len(samples) // 2]
+    results["startup.first_menu_frame"] = result(first_frame * 1000, "ms", "lower")
+    results["startup.import_code08"] = result(imports * 1000, "ms", "lower")
+    results["startup.snake_game_init"] = result(game * 1000, "ms", "lower")
+
+SUITES = {
+    "engine": bench_engine,
+    "state": bench_state,
+    "food": bench_food,
+    "render": bench_render,
+    "observe": bench_observe,
+    "arena": bench_arena,
+    "history": bench_history,
+    "startup": bench_startup,
+}
+
+# Returns the names of results that got worse by more than `threshold`
+def compare(results, baseline, threshold):
+    regressions = []
+    print(f"{'benchmark':40} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, current in results.items():
+        old = baseline.get(name)
+        if old is None or not old["value"]:
+            print(f"{name:40} {'-':>12} {current['value']:12.3f}")
+            continue
+        change = current["value"] / old["value"] - 1
+        worse = -change if current["better"] == "higher" else change
+        flag = ""
+        if worse > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:40} {old['value']:12.3f} {current['value']:12.3f} {change:+8.1%}{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the snake engine, renderer, history and startup")
+    parser.add_argument("--only", help="comma separated suites: " + ",".join(SUITES))
+    parser.add_argument("--quick", action="store_true", help="smaller sizes, skips the 1M entry history")
+    parser.add_argument("--out", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="baseline JSON from an earlier --out")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed slowdown before flagging, default 10%%")
+    args = parser.parse_args()
+
+    suites = args.only.split(",") if args.only else list(SUITES)
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch:
+        # SnakeGame and the history store write files in the working directory
+        os.chdir(scratch)
+        try:
+            for suite in suites:
+                print(f"Running {suite}...", file=sys.stderr)
+                SUITES[suite](results, args.quick)
+        finally:
+            os.chdir(cwd)
+
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "quick": args.quick,
+        },
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+if __name__ == '__main__':
+    main()
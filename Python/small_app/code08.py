@@ -1,55 +1,46 @@
 import pygame
-import random
+import argparse
+import math
+import os
 import time
-import json
+from collections import deque
 from pygame.locals import *
-
-# Initialize pygame
-pygame.init()
-
-# Game configuration
-class Config:
-    SCREEN_WIDTH = 1000
-    SCREEN_HEIGHT = 800
-    GRID_SIZE = 20
-    BG_COLOR = (40, 40, 40)
-    SNAKE_COLOR = (0, 255, 0)
-    FOOD_COLOR = (255, 0, 0)
-    OBSTACLE_COLOR = (150, 150, 150)
-    TEXT_COLOR = (255, 255, 255)
-    BUTTON_COLOR = (70, 130, 180)
-    BUTTON_HOVER_COLOR = (100, 160, 210)
-    HISTORY_FILE = "snake_history.json"
-    MAX_HISTORY_ENTRIES = 100
-    INPUT_BOX_COLOR = (230, 230, 230)
-    INPUT_TEXT_COLOR = (0, 0, 0)
-
-# Directions
-class Direction:
-    UP = (0, -1)
-    DOWN = (0, 1)
-    LEFT = (-1, 0)
-    RIGHT = (1, 0)
+from snake_config import Config, Direction
+from snake_engine import SnakeEngine, SNAKE, OBSTACLE
+from snake_world import WorldEngine, parse_world
+from snake_board import cell_rect, follow_head, board_key, draw_obstacles, draw_pieces
+from snake_text import TextCache, get_font
+from snake_history import HistoryStore
+from snake_replay import Replay
+from snake_profiler import FrameProfiler
+from snake_autopilot import Autopilot
 
 # Button class
 class Button:
     def __init__(self, x, y, width, height, text, font_size=24):
         self.rect = pygame.Rect(x, y, width, height)
         self.text = text
-        self.font = pygame.font.SysFont('Arial', font_size)
+        self.font = get_font('Arial', font_size)
         self.normal_color = Config.BUTTON_COLOR
         self.hover_color = Config.BUTTON_HOVER_COLOR
         self.text_color = Config.TEXT_COLOR
         self.is_hovered = False
+        # The label never changes, render it once
+        self.text_surface = self.font.render(self.text, True, self.text_color)
+        self.text_rect = self.text_surface.get_rect(center=self.rect.center)
+        # Both looks of the button, indexed by is_hovered
+        self.surfaces = [self.render(self.normal_color), self.render(self.hover_color)]
+    
+    def render(self, color):
+        surface = pygame.Surface(self.rect.size, pygame.SRCALPHA)
+        local = surface.get_rect()
+        pygame.draw.rect(surface, color, local, border_radius=5)
+        pygame.draw.rect(surface, (0, 0, 0), local, 2, border_radius=5)
+        surface.blit(self.text_surface, self.text_surface.get_rect(center=local.center))
+        return surface
     
     def draw(self, surface):
-        color = self.hover_color if self.is_hovered else self.normal_color
-        pygame.draw.rect(surface, color, self.rect, border_radius=5)
-        pygame.draw.rect(surface, (0, 0, 0), self.rect, 2, border_radius=5)
-        
-        text_surface = self.font.render(self.text, True, self.text_color)
-        text_rect = text_surface.get_rect(center=self.rect.center)
-        surface.blit(text_surface, text_rect)
+        surface.blit(self.surfaces[self.is_hovered], self.rect)
     
     def check_hover(self, pos):
         self.is_hovered = self.rect.collidepoint(pos)
@@ -58,49 +49,308 @@ class Button:
     def is_clicked(self, pos, event):
         return event.type == MOUSEBUTTONDOWN and event.button == 1 and self.rect.collidepoint(pos)
 
+# Game history table. Rows are rendered to surfaces once and only the rows
+# around the visible window are kept, so frame cost doesn't grow with history
+class HistoryView:
+    COLUMN_WIDTHS = [100, 180, 80, 100, 60, 60]  # Mode, Start Time, Duration, Difficulty, Speed, Score
+    HEADERS = ["Mode", "Start Time", "Duration", "Difficulty", "Speed", "Score"]
+    ROW_HEIGHT = 30
+    VISIBLE_ROWS = 15
+    BLOCK_SIZE = 64     # Entries fetched from the store per query
+    CACHE_MARGIN = 45   # Rows kept rendered above and below the window
+    
+    def __init__(self, store, font, small_font, x=50, y=120):
+        self.store = store
+        self.font = font
+        self.small_font = small_font
+        self.x = x
+        self.y = y
+        
+        # Column offsets never change
+        self.column_x = []
+        offset = 0
+        for width in self.COLUMN_WIDTHS:
+            self.column_x.append(offset)
+            offset += width + 10
+        self.table_width = sum(self.COLUMN_WIDTHS) + (len(self.COLUMN_WIDTHS) - 1) * 10
+        self.body_rect = pygame.Rect(x, y + self.ROW_HEIGHT, self.table_width, self.VISIBLE_ROWS * self.ROW_HEIGHT)
+        self.header = self.render_header()
+        
+        self.total = 0
+        self.scroll = 0.0
+        self.target = 0.0
+        self.rows = {}
+        self.blocks = {}
+    
+    def render_header(self):
+        width = self.column_x[-1] + self.COLUMN_WIDTHS[-1] + 10
+        header = pygame.Surface((width + 1, self.VISIBLE_ROWS * self.ROW_HEIGHT + 1), pygame.SRCALPHA)
+        for header_text, x, width in zip(self.HEADERS, self.column_x, self.COLUMN_WIDTHS):
+            header.blit(self.font.render(header_text, True, Config.TEXT_COLOR), (x + 5, 5))
+            pygame.draw.line(header, Config.TEXT_COLOR, (x, self.ROW_HEIGHT), (x + width, self.ROW_HEIGHT), 2)
+        for x in self.column_x + [self.column_x[-1] + self.COLUMN_WIDTHS[-1] + 10]:
+            pygame.draw.line(header, Config.TEXT_COLOR, (x, 0), (x, self.VISIBLE_ROWS * self.ROW_HEIGHT), 1)
+        return header
+    
+    # Called when the history screen opens
+    def refresh(self):
+        self.store.flush()
+        self.total = self.store.count()
+        self.rows.clear()
+        self.blocks.clear()
+        self.scroll_to(self.target)
+        self.scroll = self.target
+    
+    def max_scroll(self):
+        return max(0, self.total - self.VISIBLE_ROWS) * self.ROW_HEIGHT
+    
+    def scroll_to(self, pixels):
+        self.target = min(max(0, pixels), self.max_scroll())
+    
+    def scroll_rows(self, rows):
+        self.scroll_to(self.target + rows * self.ROW_HEIGHT)
+    
+    def entry(self, index):
+        block = index // self.BLOCK_SIZE
+        entries = self.blocks.get(block)
+        if entries is None:
+            entries = self.store.page(block * self.BLOCK_SIZE, self.BLOCK_SIZE)
+            self.blocks[block] = entries
+        return entries[index % self.BLOCK_SIZE]
+    
+    def row_surface(self, index):
+        surface = self.rows.get(index)
+        if surface is None:
+            surface = pygame.Surface((self.table_width, self.ROW_HEIGHT))
+            # Alternate row colors
+            surface.fill((60, 60, 60) if index % 2 == 0 else (80, 80, 80))
+            game = self.entry(index)
+            cells = [
+                game["mode"],
+                game["start_time"],
+                f"{game['duration']}s",
+                game["difficulty"],
+                str(game["speed"]),
+                str(game["score"])
+            ]
+            for x, cell in zip(self.column_x, cells):
+                surface.blit(self.small_font.render(cell, True, Config.TEXT_COLOR), (x + 5, 5))
+            self.rows[index] = surface
+        return surface
+    
+    def first_visible(self):
+        return int(self.scroll // self.ROW_HEIGHT)
+    
+    def draw(self, surface):
+        # Ease towards the scroll target for smooth pixel scrolling
+        self.scroll += (self.target - self.scroll) * 0.3
+        if abs(self.target - self.scroll) < 0.5:
+            self.scroll = self.target
+        
+        surface.blit(self.header, (self.x, self.y))
+        
+        first = self.first_visible()
+        row_y = self.body_rect.top - (self.scroll - first * self.ROW_HEIGHT)
+        surface.set_clip(self.body_rect)
+        for index in range(first, min(first + self.VISIBLE_ROWS + 1, self.total)):
+            surface.blit(self.row_surface(index), (self.x, row_y))
+            row_y += self.ROW_HEIGHT
+        surface.set_clip(None)
+        
+        # Forget rows and blocks that scrolled far away
+        low = first - self.CACHE_MARGIN
+        high = first + self.VISIBLE_ROWS + self.CACHE_MARGIN
+        if len(self.rows) > self.VISIBLE_ROWS + 2 * self.CACHE_MARGIN:
+            for index in [i for i in self.rows if i < low or i > high]:
+                del self.rows[index]
+        if len(self.blocks) > 4:
+            for block in [b for b in self.blocks if (b + 1) * self.BLOCK_SIZE < low or b * self.BLOCK_SIZE > high]:
+                del self.blocks[block]
+
+# Statistics screen: most played settings, the top scores of the selected
+# one and the last days played. Everything comes from the aggregate tables
+# the history store updates with every game, so it opens as fast with a
+# million games as with ten.
+class StatsView:
+    COLUMN_WIDTHS = [100, 100, 60, 80, 100, 60, 90, 90]
+    HEADERS = ["Mode", "Difficulty", "Speed", "Games", "Avg Score", "Best", "Median", "90%"]
+    LEADER_WIDTHS = [60, 70, 100, 180]
+    LEADER_HEADERS = ["Rank", "Score", "Duration", "Date"]
+    DAY_WIDTHS = [120, 70, 100]
+    DAY_HEADERS = ["Day", "Games", "Avg Score"]
+    ROW_HEIGHT = 26
+    MAX_BRACKETS = 8
+    LEADERS = 10
+    DAYS = 7
+    
+    def __init__(self, store, font, small_font):
+        self.store = store
+        self.font = font
+        self.small_font = small_font
+        self.brackets = []
+        self.percentiles = []
+        self.leaders = []
+        self.days = []
+        self.selected = 0
+        # Bumped whenever what the screen shows changes
+        self.version = 0
+    
+    # Called when the stats screen opens
+    def refresh(self):
+        self.store.flush()
+        self.brackets = self.store.brackets()[:self.MAX_BRACKETS]
+        self.percentiles = [self.store.duration_percentiles(b["mode"], b["difficulty"], b["speed"])
+                            for b in self.brackets]
+        self.days = self.store.days(self.DAYS)
+        self.select(0)
+    
+    def select(self, step):
+        self.selected = min(max(0, self.selected + step), max(0, len(self.brackets) - 1))
+        if self.brackets:
+            bracket = self.brackets[self.selected]
+            self.leaders = self.store.leaderboard(bracket["mode"], bracket["difficulty"], bracket["speed"],
+                                                  self.LEADERS)
+        self.version += 1
+    
+    def draw_row(self, surface, font, cells, widths, x, y):
+        for cell, width in zip(cells, widths):
+            surface.blit(font.render(cell, True, Config.TEXT_COLOR), (x + 5, y + 3))
+            x += width + 10
+    
+    def draw_header(self, surface, headers, widths, x, y):
+        self.draw_row(surface, self.font, headers, widths, x, y)
+        width = sum(widths) + (len(widths) - 1) * 10
+        pygame.draw.line(surface, Config.TEXT_COLOR, (x, y + self.ROW_HEIGHT + 2), (x + width, y + self.ROW_HEIGHT + 2), 2)
+    
+    def draw(self, surface):
+        if not self.brackets:
+            text = self.font.render('No games played yet', True, Config.TEXT_COLOR)
+            surface.blit(text, (Config.SCREEN_WIDTH // 2 - text.get_width() // 2, 150))
+            return
+        
+        x = 50
+        y = 100
+        self.draw_header(surface, self.HEADERS, self.COLUMN_WIDTHS, x, y)
+        table_width = sum(self.COLUMN_WIDTHS) + (len(self.COLUMN_WIDTHS) - 1) * 10
+        for i, (bracket, (median, p90)) in enumerate(zip(self.brackets, self.percentiles)):
+            y += self.ROW_HEIGHT
+            if i == self.selected:
+                pygame.draw.rect(surface, (255, 255, 0), (x, y + 4, table_width, self.ROW_HEIGHT), 2)
+            self.draw_row(surface, self.small_font, [
+                bracket["mode"],
+                bracket["difficulty"],
+                str(bracket["speed"]),
+                str(bracket["games"]),
+                f"{bracket['average_score']:.1f}",
+                str(bracket["best_score"]),
+                f"{median}s",
+                f"{p90}s"
+            ], self.COLUMN_WIDTHS, x, y + 4)
+        
+        y = 100 + (self.MAX_BRACKETS + 2) * self.ROW_HEIGHT
+        bracket = self.brackets[self.selected]
+        title = f"Top scores: {bracket['mode']}, {bracket['difficulty']}, speed {bracket['speed']}"
+        surface.blit(self.font.render(title, True, Config.TEXT_COLOR), (x, y))
+        self.draw_header(surface, self.LEADER_HEADERS, self.LEADER_WIDTHS, x, y + self.ROW_HEIGHT + 10)
+        for rank, game in enumerate(self.leaders, 1):
+            self.draw_row(surface, self.small_font, [
+                str(rank),
+                str(game["score"]),
+                f"{game['duration']}s",
+                game["start_time"]
+            ], self.LEADER_WIDTHS, x, y + (rank + 1) * self.ROW_HEIGHT + 14)
+        
+        x = 560
+        surface.blit(self.font.render(f"Last {self.DAYS} days played", True, Config.TEXT_COLOR), (x, y))
+        self.draw_header(surface, self.DAY_HEADERS, self.DAY_WIDTHS, x, y + self.ROW_HEIGHT + 10)
+        for i, (day, games, average) in enumerate(self.days, 2):
+            self.draw_row(surface, self.small_font, [day, str(games), f"{average:.1f}"],
+                          self.DAY_WIDTHS, x, y + i * self.ROW_HEIGHT + 14)
+
 # Main game class
 class SnakeGame:
-    def __init__(self):
+    def __init__(self, profiler=None, world=None):
+        # Only the display is started here and fonts by get_font, pygame.init()
+        # would also start audio, joysticks and the rest we never use
+        pygame.display.init()
         self.screen = pygame.display.set_mode((Config.SCREEN_WIDTH, Config.SCREEN_HEIGHT))
         pygame.display.set_caption('Snake Game')
         self.clock = pygame.time.Clock()
-        self.font = pygame.font.SysFont('Arial', 24)
-        self.big_font = pygame.font.SysFont('Arial', 36)
-        self.small_font = pygame.font.SysFont('Arial', 18)
+        self.font = get_font('Arial', 24)
+        self.big_font = get_font('Arial', 36)
+        self.small_font = get_font('Arial', 18)
+        self.text_cache = TextCache()
+        # Screen sized layers, allocated once and redrawn only when their key
+        # changes, see compose()
+        self.layers = {}
+        # Darkens the game under the pause menu and game over text
+        self.shade = pygame.Surface((Config.SCREEN_WIDTH, Config.SCREEN_HEIGHT), pygame.SRCALPHA)
+        self.shade.fill((0, 0, 0, 128))
+        self.profiler = profiler
+        # (cols, rows) of a world bigger than the window, None for the normal board
+        self.world = world
+        # Connection to a snake_server room while playing as a thin client
+        self.remote = None
         
         # Game state
         self.reset_game()
         self.create_buttons()
-        self.history = self.load_history()
-        self.history_scroll_offset = 0
+        # Opened and migrated from the old JSON file on the store's thread,
+        # the menu doesn't wait for it
+        self.history_store = HistoryStore(Config.HISTORY_DB, import_path=Config.HISTORY_FILE)
+        self.history_view = HistoryView(self.history_store, self.font, self.small_font)
+        self.stats_view = StatsView(self.history_store, self.font, self.small_font)
+        # Plans on its own thread, only used while autopilot_on
+        self.autopilot = Autopilot()
+        
+        if profiler:
+            # draw_cell runs once per changed cell, too small to time on its own
+            phases = [name for name in dir(self) if name.startswith('draw_') and name != 'draw_cell']
+            profiler.instrument(self, ['handle_events', 'update', 'tick', 'draw'] + phases)
     
     def reset_game(self):
-        self.snake = [
-            [Config.SCREEN_WIDTH // 2, Config.SCREEN_HEIGHT // 2],
-            [Config.SCREEN_WIDTH // 2 - Config.GRID_SIZE, Config.SCREEN_HEIGHT // 2],
-            [Config.SCREEN_WIDTH // 2 - 2 * Config.GRID_SIZE, Config.SCREEN_HEIGHT // 2]
-        ]
+        if self.remote:
+            self.remote.close()
+            self.remote = None
+        self.engine = self.new_engine()
+        # Top left cell of the view, it only moves in a world bigger than the window
+        self.camera = (0, 0)
         self.direction = Direction.RIGHT
-        self.next_direction = Direction.RIGHT
-        self.score = 0
-        self.food_count = 0
-        self.obstacles = []
-        self.food = self.generate_food()
+        # Turns waiting for the next ticks, applied one per tick
+        self.input_queue = deque()
+        # Elapsed time not yet turned into simulation ticks
+        self.accumulator = 0.0
+        # Ticks skipped because the game fell more than MAX_CATCH_UP behind
+        self.dropped_ticks = 0
+        # Recording of the current game, and the moves of a replay being watched
+        self.replay = None
+        self.playback = None
+        self.playback_speed = None
+        self.autopilot_on = False
+        self.autopilot_used = False
         self.game_over = False
         self.paused = False
         self.game_started = False
         self.in_menu = True
         self.in_game_setup = False
         self.in_history = False
+        self.in_stats = False
         self.in_speedrun = False
         self.difficulty = None
         self.start_time = None
         self.end_time = None
+        self.countdown_end = None
         self.pause_time = 0
         self.total_pause_time = 0
         self.speed_input = ""
         self.speed_input_active = False
         self.speed_error = ""
+        # What the in-game view currently shows, see draw()
+        self.drawn_state = None
+        self.dirty_cells = []
+        self.hud_rect = None
+        self.profiler_rect = None
+        self.marker_rect = None
     
     def create_buttons(self):
         button_width = 200
@@ -111,7 +361,8 @@ class SnakeGame:
         self.start_button = Button(center_x, 200, button_width, button_height, "Start Game")
         self.speedrun_button = Button(center_x, 280, button_width, button_height, "Speedrun Mode")
         self.history_button = Button(center_x, 360, button_width, button_height, "Game History")
-        self.quit_button = Button(center_x, 440, button_width, button_height, "Quit")
+        self.stats_button = Button(center_x, 440, button_width, button_height, "Statistics")
+        self.quit_button = Button(center_x, 520, button_width, button_height, "Quit")
         
         # Game setup buttons
         self.easy_button = Button(center_x, 150, button_width, button_height, "Easy")
@@ -130,17 +381,8 @@ class SnakeGame:
         self.restart_button = Button(center_x, 380, button_width, button_height, "New Game")
         self.menu_button = Button(center_x, 460, button_width, button_height, "Main Menu")
     
-    def load_history(self):
-        try:
-            with open(Config.HISTORY_FILE, 'r') as f:
-                history = json.load(f)
-                return history[-Config.MAX_HISTORY_ENTRIES:]
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
-    
-    def save_history(self):
-        with open(Config.HISTORY_FILE, 'w') as f:
-            json.dump(self.history[-Config.MAX_HISTORY_ENTRIES:], f)
+    def new_engine(self):
+        return WorldEngine(*self.world) if self.world else SnakeEngine()
     
     def add_game_to_history(self):
         game_data = {
@@ -149,87 +391,46 @@ class SnakeGame:
             "end_time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.end_time)),
             "duration": round(self.end_time - self.start_time - self.total_pause_time, 2),
             "difficulty": self.difficulty if not self.in_speedrun else "N/A",
-            "speed": self.speed,
-            "score": self.score
+            "speed": self.engine.speed,
+            "score": self.engine.score
         }
-        self.history.append(game_data)
-        self.save_history()
-    
-    def generate_food(self):
-        while True:
-            x = random.randint(0, (Config.SCREEN_WIDTH - Config.GRID_SIZE) // Config.GRID_SIZE) * Config.GRID_SIZE
-            y = random.randint(0, (Config.SCREEN_HEIGHT - Config.GRID_SIZE) // Config.GRID_SIZE) * Config.GRID_SIZE
-            if [x, y] not in self.snake and [x, y] not in self.obstacles:
-                return [x, y]
-    
-    def generate_obstacles(self, count):
-        self.obstacles = []
-        for _ in range(count):
-            while True:
-                x = random.randint(3, (Config.SCREEN_WIDTH - Config.GRID_SIZE) // Config.GRID_SIZE - 3) * Config.GRID_SIZE
-                y = random.randint(3, (Config.SCREEN_HEIGHT - Config.GRID_SIZE) // Config.GRID_SIZE - 3) * Config.GRID_SIZE
-                
-                if self.difficulty == "Hard" and random.random() < 0.3:
-                    wall_length = random.randint(2, 3)
-                    wall_direction = random.choice(["horizontal", "vertical"])
-                    
-                    valid = True
-                    temp_obstacles = []
-                    for i in range(wall_length):
-                        if wall_direction == "horizontal":
-                            new_x = x + i * Config.GRID_SIZE
-                            new_y = y
-                        else:
-                            new_x = x
-                            new_y = y + i * Config.GRID_SIZE
-                        
-                        if (new_x >= Config.SCREEN_WIDTH or new_y >= Config.SCREEN_HEIGHT or
-                            [new_x, new_y] in self.snake or [new_x, new_y] == self.food or
-                            [new_x, new_y] in self.obstacles):
-                            valid = False
-                            break
-                        
-                        temp_obstacles.append([new_x, new_y])
-                    
-                    if valid:
-                        self.obstacles.extend(temp_obstacles)
-                        break
-                else:
-                    if [x, y] not in self.snake and [x, y] != self.food and [x, y] not in self.obstacles:
-                        self.obstacles.append([x, y])
-                        break
+        if self.autopilot_used:
+            game_data["autopilot"] = True
+        if self.world:
+            game_data["world"] = f"{self.engine.cols}x{self.engine.rows}"
+        files = None
+        if self.replay:
+            self.replay.finish(self.engine)
+            replay_name = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.start_time)) + f"-{self.engine.seed:016x}.snkr"
+            game_data["replay"] = os.path.join(Config.REPLAY_DIR, replay_name)
+            files = {game_data["replay"]: self.replay.to_bytes()}
+        # Written to disk by the store's background thread
+        self.history_store.add(game_data, files)
     
     def move_snake(self):
-        head = self.snake[0].copy()
-        head[0] += self.direction[0] * Config.GRID_SIZE
-        head[1] += self.direction[1] * Config.GRID_SIZE
-        
-        # Check collisions
-        if (head[0] < 0 or head[0] >= Config.SCREEN_WIDTH or 
-            head[1] < 0 or head[1] >= Config.SCREEN_HEIGHT or
-            head in self.snake or head in self.obstacles):
+        if self.replay:
+            self.replay.record(self.engine.ticks, self.direction)
+        food = self.engine.food
+        self.engine.step(self.direction)
+        if self.engine.game_over:
             self.game_over = True
             self.end_time = time.time()
-            self.add_game_to_history()
+            if self.playback is None:
+                self.add_game_to_history()
             return
-        
-        self.snake.insert(0, head)
-        
-        if head == self.food:
-            self.score += 1
-            self.food_count += 1
-            self.food = self.generate_food()
-            
-            if self.in_speedrun and self.food_count % 5 == 0:
-                self.speed += 1
-            
-            if not self.in_speedrun:
-                if self.difficulty == "Medium":
-                    self.generate_obstacles(3)
-                elif self.difficulty == "Hard":
-                    self.generate_obstacles(5)
-        else:
-            self.snake.pop()
+        self.note_move(food)
+    
+    # Remember the cells that changed for the dirty-rect renderer
+    def note_move(self, food):
+        self.follow_head()
+        self.dirty_cells.append(self.engine.snake[0])
+        if self.engine.vacated:
+            self.dirty_cells.append(self.engine.vacated)
+        if self.engine.food != food and self.engine.food:
+            self.dirty_cells.append(self.engine.food)
+    
+    def follow_head(self, center=False):
+        self.camera = follow_head(self.engine, self.camera, center)
     
     def handle_events(self):
         mouse_pos = pygame.mouse.get_pos()
@@ -239,18 +440,28 @@ class SnakeGame:
                 pygame.quit()
                 return False
             
+            if event.type == KEYDOWN and event.key == K_F3 and self.profiler:
+                self.profiler.visible = not self.profiler.visible
+                continue
+            
             if self.in_menu:
                 self.handle_menu_events(event, mouse_pos)
             elif self.in_game_setup:
                 self.handle_setup_events(event, mouse_pos)
             elif self.in_history:
                 self.handle_history_events(event, mouse_pos)
+            elif self.in_stats:
+                self.handle_stats_events(event)
             elif self.paused:
                 self.handle_pause_events(event, mouse_pos)
+            elif self.countdown_end is not None:
+                self.handle_countdown_events(event)
             elif not self.game_over and self.game_started:
                 self.handle_game_events(event)
             elif self.game_over:
-                if event.type == KEYDOWN and event.key == K_r:
+                if event.type == KEYDOWN and event.key == K_r and self.remote:
+                    self.remote.restart()
+                elif event.type == KEYDOWN and event.key == K_r:
                     self.reset_game()
                     if self.in_speedrun:
                         self.start_speedrun()
@@ -263,6 +474,7 @@ class SnakeGame:
         self.start_button.check_hover(mouse_pos)
         self.speedrun_button.check_hover(mouse_pos)
         self.history_button.check_hover(mouse_pos)
+        self.stats_button.check_hover(mouse_pos)
         self.quit_button.check_hover(mouse_pos)
         
         if event.type == MOUSEBUTTONDOWN and event.button == 1:
@@ -274,6 +486,11 @@ class SnakeGame:
             elif self.history_button.rect.collidepoint(mouse_pos):
                 self.in_menu = False
                 self.in_history = True
+                self.history_view.refresh()
+            elif self.stats_button.rect.collidepoint(mouse_pos):
+                self.in_menu = False
+                self.in_stats = True
+                self.stats_view.refresh()
             elif self.quit_button.rect.collidepoint(mouse_pos):
                 pygame.quit()
                 return False
@@ -326,13 +543,35 @@ class SnakeGame:
     def handle_history_events(self, event, mouse_pos):
         if event.type == MOUSEBUTTONDOWN:
             if event.button == 4:  # Mouse wheel up
-                self.history_scroll_offset = max(0, self.history_scroll_offset - 1)
+                self.history_view.scroll_rows(-1)
             elif event.button == 5:  # Mouse wheel down
-                max_offset = max(0, len(self.history) - 10)
-                self.history_scroll_offset = min(max_offset, self.history_scroll_offset + 1)
+                self.history_view.scroll_rows(1)
             elif event.button == 1:  # Left click
                 self.in_history = False
                 self.in_menu = True
+        elif event.type == KEYDOWN:
+            if event.key == K_UP:
+                self.history_view.scroll_rows(-1)
+            elif event.key == K_DOWN:
+                self.history_view.scroll_rows(1)
+            elif event.key == K_PAGEUP:
+                self.history_view.scroll_rows(-HistoryView.VISIBLE_ROWS)
+            elif event.key == K_PAGEDOWN:
+                self.history_view.scroll_rows(HistoryView.VISIBLE_ROWS)
+            elif event.key == K_HOME:
+                self.history_view.scroll_to(0)
+            elif event.key == K_END:
+                self.history_view.scroll_to(self.history_view.max_scroll())
+    
+    def handle_stats_events(self, event):
+        if event.type == MOUSEBUTTONDOWN and event.button == 1:
+            self.in_stats = False
+            self.in_menu = True
+        elif event.type == KEYDOWN:
+            if event.key == K_UP:
+                self.stats_view.select(-1)
+            elif event.key == K_DOWN:
+                self.stats_view.select(1)
     
     def handle_pause_events(self, event, mouse_pos):
         self.continue_button.check_hover(mouse_pos)
@@ -355,6 +594,11 @@ class SnakeGame:
                 self.reset_game()
                 self.in_menu = True
     
+    def handle_countdown_events(self, event):
+        if event.type == KEYDOWN and event.key == K_b:  # Back to menu
+            self.reset_game()
+            self.in_menu = True
+    
     def handle_game_events(self, event):
         if event.type == KEYDOWN:
             if event.key == K_p:
@@ -362,21 +606,48 @@ class SnakeGame:
             elif event.key == K_b:  # Back to menu
                 self.reset_game()
                 self.in_menu = True
+            elif self.remote and event.key in (K_n, K_TAB):
+                pass
             elif event.key == K_n:  # New game same mode
                 self.reset_game()
                 if self.in_speedrun:
                     self.start_speedrun()
                 else:
                     self.start_game()
-            elif not self.paused:
-                if event.key in (K_UP, K_w) and self.direction != Direction.DOWN:
-                    self.next_direction = Direction.UP
-                elif event.key in (K_DOWN, K_s) and self.direction != Direction.UP:
-                    self.next_direction = Direction.DOWN
-                elif event.key in (K_LEFT, K_a) and self.direction != Direction.RIGHT:
-                    self.next_direction = Direction.LEFT
-                elif event.key in (K_RIGHT, K_d) and self.direction != Direction.LEFT:
-                    self.next_direction = Direction.RIGHT
+            elif event.key == K_TAB and self.playback is None and not self.world:
+                self.toggle_autopilot()
+            elif not self.paused and self.playback is None:
+                if event.key in (K_UP, K_w):
+                    self.queue_direction(Direction.UP)
+                elif event.key in (K_DOWN, K_s):
+                    self.queue_direction(Direction.DOWN)
+                elif event.key in (K_LEFT, K_a):
+                    self.queue_direction(Direction.LEFT)
+                elif event.key in (K_RIGHT, K_d):
+                    self.queue_direction(Direction.RIGHT)
+    
+    def queue_direction(self, direction):
+        if self.remote:
+            # The server's room keeps the queue
+            self.remote.turn(direction)
+            return
+        # Steering by hand takes over from the autopilot
+        self.autopilot_on = False
+        # Checked against the last queued turn, so quick combos like
+        # up-then-left within one tick both get through
+        last = self.input_queue[-1] if self.input_queue else self.direction
+        if direction == last or (direction[0] == -last[0] and direction[1] == -last[1]):
+            return
+        if len(self.input_queue) < Config.INPUT_QUEUE_SIZE:
+            self.input_queue.append(direction)
+    
+    def toggle_autopilot(self):
+        self.autopilot_on = not self.autopilot_on
+        if self.autopilot_on:
+            self.autopilot_used = True
+            self.input_queue.clear()
+            self.autopilot.reset()
+            self.autopilot.after_tick(self.engine)
     
     def start_game(self):
         # Validate speed before starting
@@ -390,27 +661,73 @@ class SnakeGame:
             self.speed_error = "Please enter a valid number"
             return
         
-        if self.difficulty == "Easy":
-            self.obstacles = []
-        elif self.difficulty == "Medium":
-            self.generate_obstacles(5)
-        elif self.difficulty == "Hard":
-            self.generate_obstacles(10)
+        self.engine.reset(self.difficulty, self.speed)
+        self.follow_head(center=True)
+        self.replay = Replay.for_engine(self.engine)
         
         self.in_game_setup = False
         self.game_started = True
         self.in_speedrun = False
-        self.start_time = time.time()
-        self.countdown(3)
+        self.start_countdown(3)
     
     def start_speedrun(self):
-        self.obstacles = []
-        self.speed = 5
+        self.engine.reset(speed=5, speedrun=True)
+        self.follow_head(center=True)
+        self.replay = Replay.for_engine(self.engine)
         self.in_menu = False
         self.game_started = True
         self.in_speedrun = True
+        self.start_countdown(3)
+    
+    # Thin client: the game runs in a server room, this only draws it
+    def start_remote(self, remote):
+        self.reset_game()
+        self.remote = remote
+        self.engine = remote.engine
+        # Until the first snapshot tells the room's settings
+        self.difficulty = remote.difficulty
+        self.in_speedrun = remote.speedrun
+        self.in_menu = False
+        self.game_started = True
+        self.start_time = time.time()
+    
+    def update_remote(self):
+        for body in self.remote.poll():
+            if body is None:
+                # Back to the menu
+                self.reset_game()
+                return
+            food = self.engine.food
+            self.engine.apply(body)
+            if body[:1] == b'S':
+                self.difficulty = self.engine.difficulty
+                self.in_speedrun = self.engine.speedrun
+            if self.engine.game_over:
+                if not self.game_over:
+                    self.game_over = True
+                    self.end_time = time.time()
+            elif self.game_over:
+                # The room was restarted
+                self.game_over = False
+                self.start_time = time.time()
+            else:
+                self.note_move(food)
+    
+    # Watch a recorded game, at its own speed unless one is given
+    def start_replay(self, replay, speed=None):
+        self.reset_game()
+        self.engine = replay.new_engine()
+        self.follow_head(center=True)
+        self.playback = replay.actions()
+        self.playback_speed = speed
+        self.difficulty = replay.difficulty
+        self.in_speedrun = replay.speedrun
+        self.in_menu = False
+        self.game_started = True
         self.start_time = time.time()
-        self.countdown(3)
+    
+    def tick_rate(self):
+        return self.playback_speed or self.engine.speed
     
     def pause_game(self):
         self.paused = True
@@ -420,60 +737,120 @@ class SnakeGame:
         self.paused = False
         self.total_pause_time += time.time() - self.pause_time
     
-    def countdown(self, seconds):
-        for i in range(seconds, 0, -1):
-            self.screen.fill(Config.BG_COLOR)
-            countdown_text = self.big_font.render(str(i), True, (255, 0, 0))
-            self.screen.blit(countdown_text, 
-                           (Config.SCREEN_WIDTH // 2 - countdown_text.get_width() // 2, 
-                            Config.SCREEN_HEIGHT // 2 - countdown_text.get_height() // 2))
-            pygame.display.flip()
-            pygame.time.wait(1000)
-    
-    def update(self):
+    # The countdown is a timed state of the main loop, events and drawing
+    # keep running while it lasts
+    def start_countdown(self, seconds):
+        self.countdown_end = time.time() + seconds
+    
+    def update(self, dt):
+        if self.countdown_end is not None:
+            if time.time() < self.countdown_end:
+                return
+            # The game clock starts exactly when the countdown ends
+            self.start_time = self.countdown_end
+            self.countdown_end = None
+            self.accumulator = 0.0
+        
+        if self.remote:
+            if not self.paused:
+                self.update_remote()
+            return
+        
         if not self.game_started or self.paused or self.game_over:
             return
         
-        self.direction = self.next_direction
+        # Fixed timestep: one tick every 1 / speed seconds, however fast we
+        # render, so a frame runs as many ticks as the speed asks for. Only
+        # after a stall is the backlog dropped instead of spiralling, and the
+        # HUD shows how much was lost.
+        self.accumulator += dt
+        if self.accumulator > Config.MAX_CATCH_UP:
+            self.dropped_ticks += int((self.accumulator - Config.MAX_CATCH_UP) * self.tick_rate())
+            self.accumulator = Config.MAX_CATCH_UP
+        while self.accumulator >= 1.0 / self.tick_rate() and not self.game_over:
+            self.accumulator -= 1.0 / self.tick_rate()
+            self.tick()
+    
+    def tick(self):
+        if self.playback is not None:
+            self.direction = self.playback.get(self.engine.ticks, self.direction)
+        elif self.autopilot_on:
+            self.direction = self.autopilot.next_direction(self.engine)
+        elif self.input_queue:
+            self.direction = self.input_queue.popleft()
         self.move_snake()
+        if self.autopilot_on:
+            # Start planning the next ticks while this frame is drawn
+            self.autopilot.after_tick(self.engine)
+    
+    def is_playing(self):
+        return (not (self.in_menu or self.in_game_setup or self.in_history or self.in_stats) and
+                self.game_started and self.countdown_end is None and
+                not self.game_over and not self.paused)
     
     def draw(self):
-        self.screen.fill(Config.BG_COLOR)
+        # Only repaint changed cells and the HUD while the screen still shows
+        # this game with the same obstacle layout from the same camera position
+        if (Config.DIRTY_RECTS and self.is_playing() and
+                self.drawn_state == (self.engine, self.engine.obstacle_version, self.camera)):
+            pygame.display.update(self.draw_game_dirty())
+            return
         
+        # Every screen but the countdown starts from a cached layer
         if self.in_menu:
             self.draw_menu()
         elif self.in_game_setup:
             self.draw_game_setup()
         elif self.in_history:
             self.draw_history()
+        elif self.in_stats:
+            self.draw_stats()
         elif not self.game_started:
-            pass
+            self.screen.fill(Config.BG_COLOR)
+        elif self.countdown_end is not None:
+            self.screen.fill(Config.BG_COLOR)
+            self.draw_countdown()
         elif self.game_over:
             self.draw_game_over()
         elif self.paused:
-            self.draw_game()
             self.draw_pause_menu()
         else:
             self.draw_game()
         
+        self.profiler_rect = self.draw_profiler()
         pygame.display.flip()
+        self.drawn_state = (self.engine, self.engine.obstacle_version, self.camera) if self.is_playing() else None
+        self.dirty_cells = []
+    
+    # Blits the screen sized layer `name`. It is drawn again with draw_static,
+    # on a cleared screen, only when it was last drawn for a different key.
+    def compose(self, name, key, draw_static):
+        layer = self.layers.get(name)
+        if layer is None:
+            layer = self.layers[name] = [None, pygame.Surface(self.screen.get_size()).convert()]
+        if layer[0] == key:
+            self.screen.blit(layer[1], (0, 0))
+            return
+        self.screen.fill(Config.BG_COLOR)
+        draw_static()
+        layer[1].blit(self.screen, (0, 0))
+        layer[0] = key
     
     def draw_menu(self):
-        title = self.big_font.render('Snake Game', True, Config.TEXT_COLOR)
-        self.screen.blit(title, (Config.SCREEN_WIDTH // 2 - title.get_width() // 2, 100))
+        self.compose('screen', 'menu', self.draw_menu_title)
         
         self.start_button.draw(self.screen)
         self.speedrun_button.draw(self.screen)
         self.history_button.draw(self.screen)
+        self.stats_button.draw(self.screen)
         self.quit_button.draw(self.screen)
     
+    def draw_menu_title(self):
+        title = self.text_cache.render(self.big_font, 'Snake Game', Config.TEXT_COLOR)
+        self.screen.blit(title, (Config.SCREEN_WIDTH // 2 - title.get_width() // 2, 100))
+    
     def draw_game_setup(self):
-        title = self.big_font.render('Game Setup', True, Config.TEXT_COLOR)
-        self.screen.blit(title, (Config.SCREEN_WIDTH // 2 - title.get_width() // 2, 50))
-        
-        # Draw difficulty selection
-        difficulty_text = self.font.render('Select Difficulty:', True, Config.TEXT_COLOR)
-        self.screen.blit(difficulty_text, (Config.SCREEN_WIDTH // 2 - difficulty_text.get_width() // 2, 120))
+        self.compose('screen', 'setup', self.draw_setup_labels)
         
         self.easy_button.draw(self.screen)
         self.medium_button.draw(self.screen)
@@ -492,10 +869,6 @@ class SnakeGame:
             if diff_rect:
                 pygame.draw.rect(self.screen, (255, 255, 0), diff_rect, 3, border_radius=5)
         
-        # Draw speed input
-        speed_text = self.font.render('Enter Speed (1+):', True, Config.TEXT_COLOR)
-        self.screen.blit(speed_text, (Config.SCREEN_WIDTH // 2 - speed_text.get_width() // 2, 340))
-        
         # Draw input box
         pygame.draw.rect(self.screen, 
                         Config.INPUT_BOX_COLOR if self.speed_input_active else (200, 200, 200), 
@@ -503,142 +876,204 @@ class SnakeGame:
         pygame.draw.rect(self.screen, (0, 0, 0), self.speed_input_rect, 2, border_radius=5)
         
         # Draw input text
-        input_surface = self.font.render(self.speed_input, True, Config.INPUT_TEXT_COLOR)
+        input_surface = self.text_cache.render(self.font, self.speed_input, Config.INPUT_TEXT_COLOR)
         self.screen.blit(input_surface, (self.speed_input_rect.x + 10, self.speed_input_rect.y + 15))
         
         # Draw current selected speed
         if hasattr(self, 'speed') and not self.speed_input_active and self.speed_input:
-            speed_display = self.font.render(f"Current: {self.speed}", True, Config.TEXT_COLOR)
+            speed_display = self.text_cache.render(self.font, f"Current: {self.speed}", Config.TEXT_COLOR)
             self.screen.blit(speed_display, (self.speed_input_rect.x, self.speed_input_rect.y + 50))
         
         # Draw error message
         if self.speed_error:
-            error_text = self.font.render(self.speed_error, True, (255, 0, 0))
+            error_text = self.text_cache.render(self.font, self.speed_error, (255, 0, 0))
             self.screen.blit(error_text, (self.speed_input_rect.x, self.speed_input_rect.y + 80))
         
         # Draw start and back buttons
         self.start_game_button.draw(self.screen)
         self.back_button.draw(self.screen)
     
-    def draw_history(self):
-        title = self.big_font.render('Game History', True, Config.TEXT_COLOR)
+    # The parts of the setup screen that never change
+    def draw_setup_labels(self):
+        title = self.text_cache.render(self.big_font, 'Game Setup', Config.TEXT_COLOR)
         self.screen.blit(title, (Config.SCREEN_WIDTH // 2 - title.get_width() // 2, 50))
         
-        if not self.history:
-            no_history = self.font.render('No game history yet', True, Config.TEXT_COLOR)
+        difficulty_text = self.text_cache.render(self.font, 'Select Difficulty:', Config.TEXT_COLOR)
+        self.screen.blit(difficulty_text, (Config.SCREEN_WIDTH // 2 - difficulty_text.get_width() // 2, 120))
+        
+        speed_text = self.text_cache.render(self.font, 'Enter Speed (1+):', Config.TEXT_COLOR)
+        self.screen.blit(speed_text, (Config.SCREEN_WIDTH // 2 - speed_text.get_width() // 2, 340))
+    
+    def draw_history(self):
+        self.compose('screen', 'history', self.draw_history_labels)
+        
+        view = self.history_view
+        table_bottom = view.body_rect.bottom
+        if not view.total:
+            no_history = self.text_cache.render(self.font, 'No game history yet', Config.TEXT_COLOR)
             self.screen.blit(no_history, (Config.SCREEN_WIDTH // 2 - no_history.get_width() // 2, 150))
         else:
-            # Table parameters
-            table_x = 50
-            table_y = 120
-            row_height = 30
-            visible_rows = 15
-            column_widths = [100, 180, 80, 100, 60, 60]  # Mode, Start Time, Duration, Difficulty, Speed, Score
-            
-            # Draw table headers with dividers
-            headers = ["Mode", "Start Time", "Duration", "Difficulty", "Speed", "Score"]
-            header_y = table_y
-            for i, (header, width) in enumerate(zip(headers, column_widths)):
-                header_surface = self.font.render(header, True, Config.TEXT_COLOR)
-                header_x = table_x + sum(column_widths[:i]) + i * 10
-                self.screen.blit(header_surface, (header_x + 5, header_y + 5))
-                
-                # Draw header divider
-                pygame.draw.line(self.screen, Config.TEXT_COLOR, 
-                               (header_x, header_y + row_height),
-                               (header_x + width, header_y + row_height), 2)
-            
-            # Draw vertical dividers
-            for i in range(len(column_widths) + 1):
-                divider_x = table_x + sum(column_widths[:i]) + i * 10
-                pygame.draw.line(self.screen, Config.TEXT_COLOR,
-                               (divider_x, table_y),
-                               (divider_x, table_y + visible_rows * row_height), 1)
-            
-            # Draw table rows with alternating colors
-            visible_history = self.history[self.history_scroll_offset:self.history_scroll_offset+visible_rows]
-            for row_idx, game in enumerate(visible_history):
-                row_y = table_y + (row_idx + 1) * row_height
-                
-                # Alternate row colors
-                if row_idx % 2 == 0:
-                    row_color = (60, 60, 60)
-                else:
-                    row_color = (80, 80, 80)
-                
-                pygame.draw.rect(self.screen, row_color, 
-                               (table_x, row_y, sum(column_widths) + (len(column_widths)-1)*10, row_height))
-                
-                # Draw cell content
-                cells = [
-                    game["mode"],
-                    game["start_time"],
-                    f"{game['duration']}s",
-                    game["difficulty"],
-                    str(game["speed"]),
-                    str(game["score"])
-                ]
-                
-                for i, (cell, width) in enumerate(zip(cells, column_widths)):
-                    cell_x = table_x + sum(column_widths[:i]) + i * 10 + 5
-                    cell_surface = self.small_font.render(cell, True, Config.TEXT_COLOR)
-                    self.screen.blit(cell_surface, (cell_x, row_y + 5))
+            view.draw(self.screen)
             
             # Draw scroll indicator if needed
-            if len(self.history) > visible_rows:
-                scroll_text = self.font.render(
-                    f"Showing {self.history_scroll_offset+1}-{min(self.history_scroll_offset+visible_rows, len(self.history))} of {len(self.history)}", 
-                    True, Config.TEXT_COLOR)
-                self.screen.blit(scroll_text, (Config.SCREEN_WIDTH // 2 - scroll_text.get_width() // 2, table_y + (visible_rows + 1) * row_height))
+            if view.total > view.VISIBLE_ROWS:
+                first = view.first_visible()
+                scroll_text = self.text_cache.render(self.font,
+                    f"Showing {first+1}-{min(first+view.VISIBLE_ROWS, view.total)} of {view.total}", 
+                    Config.TEXT_COLOR)
+                self.screen.blit(scroll_text, (Config.SCREEN_WIDTH // 2 - scroll_text.get_width() // 2, table_bottom))
+    
+    def draw_history_labels(self):
+        title = self.text_cache.render(self.big_font, 'Game History', Config.TEXT_COLOR)
+        self.screen.blit(title, (Config.SCREEN_WIDTH // 2 - title.get_width() // 2, 50))
         
-        back_text = self.font.render('Click to return or use mouse wheel to scroll', True, Config.TEXT_COLOR)
-        self.screen.blit(back_text, (Config.SCREEN_WIDTH // 2 - back_text.get_width() // 2, table_y + (visible_rows + 2) * row_height))
+        view = self.history_view
+        back_text = self.text_cache.render(self.font, 'Click to return, scroll with the mouse wheel or PgUp/PgDn', Config.TEXT_COLOR)
+        self.screen.blit(back_text, (Config.SCREEN_WIDTH // 2 - back_text.get_width() // 2,
+                                     view.body_rect.bottom + view.ROW_HEIGHT))
+    
+    # The whole screen only changes when the view is refreshed or a row picked
+    def draw_stats(self):
+        self.compose('screen', ('stats', self.stats_view.version), self.draw_stats_screen)
+    
+    def draw_stats_screen(self):
+        title = self.text_cache.render(self.big_font, 'Statistics', Config.TEXT_COLOR)
+        self.screen.blit(title, (Config.SCREEN_WIDTH // 2 - title.get_width() // 2, 40))
+        self.stats_view.draw(self.screen)
+        back_text = self.text_cache.render(self.font, 'Up/Down picks the settings, click to return', Config.TEXT_COLOR)
+        self.screen.blit(back_text, (Config.SCREEN_WIDTH // 2 - back_text.get_width() // 2, 740))
+    
+    def board_key(self):
+        return board_key(self.engine, self.camera)
     
     def draw_game(self):
-        # Draw obstacles
-        for obstacle in self.obstacles:
-            pygame.draw.rect(self.screen, Config.OBSTACLE_COLOR, 
-                           (*obstacle, Config.GRID_SIZE, Config.GRID_SIZE))
-        
-        # Draw snake
-        for segment in self.snake:
-            pygame.draw.rect(self.screen, Config.SNAKE_COLOR, 
-                           (*segment, Config.GRID_SIZE, Config.GRID_SIZE))
-        
-        # Draw food
-        pygame.draw.rect(self.screen, Config.FOOD_COLOR, 
-                        (*self.food, Config.GRID_SIZE, Config.GRID_SIZE))
+        # The background and obstacles only change with the obstacle layout
+        # or the camera, so they come from a layer
+        self.compose('board', self.board_key(), self.draw_obstacles)
+        draw_pieces(self.screen, self.engine, self.camera)
         
+        self.marker_rect = self.draw_food_marker()
+        self.hud_rect = self.draw_hud()
+    
+    def draw_obstacles(self):
+        draw_obstacles(self.screen, self.engine, self.camera)
+    
+    def draw_hud(self):
         # Draw game info
         current_time = time.time() - self.start_time - self.total_pause_time
-        time_text = self.font.render(f'Time: {current_time:.1f}s', True, Config.TEXT_COLOR)
-        self.screen.blit(time_text, (10, 10))
+        hud_rect = self.text_cache.blit_composed(self.screen, self.font, 'Time: ', f'{current_time:.1f}s',
+                                                 Config.TEXT_COLOR, (10, 10))
         
-        score_text = self.font.render(f'Score: {self.score}', True, Config.TEXT_COLOR)
-        self.screen.blit(score_text, (10, 40))
+        score_text = self.text_cache.render(self.font, f'Score: {self.engine.score}', Config.TEXT_COLOR)
+        hud_rect.union_ip(self.screen.blit(score_text, (10, 40)))
         
-        speed_text = self.font.render(f'Speed: {self.speed}', True, Config.TEXT_COLOR)
-        self.screen.blit(speed_text, (10, 70))
+        speed_text = self.text_cache.render(self.font, f'Speed: {self.engine.speed}', Config.TEXT_COLOR)
+        hud_rect.union_ip(self.screen.blit(speed_text, (10, 70)))
         
-        mode_text = self.font.render(f'Mode: {"Speedrun" if self.in_speedrun else self.difficulty}', True, Config.TEXT_COLOR)
-        self.screen.blit(mode_text, (10, 100))
+        mode_text = self.text_cache.render(self.font, f'Mode: {"Speedrun" if self.in_speedrun else self.difficulty}', Config.TEXT_COLOR)
+        hud_rect.union_ip(self.screen.blit(mode_text, (10, 100)))
         
         if self.in_speedrun:
-            food_text = self.font.render(f'Food: {self.food_count} (Next speed at {(self.food_count // 5 + 1) * 5})', 
-                                       True, Config.TEXT_COLOR)
-            self.screen.blit(food_text, (10, 130))
+            food_text = self.text_cache.render(self.font, f'Food: {self.engine.food_count} (Next speed at {(self.engine.food_count // 5 + 1) * 5})', 
+                                               Config.TEXT_COLOR)
+            hud_rect.union_ip(self.screen.blit(food_text, (10, 130)))
+        
+        y = 160 if self.in_speedrun else 130
+        if self.autopilot_on:
+            stats = self.autopilot.stats()
+            hud_rect.union_ip(self.text_cache.blit_composed(
+                self.screen, self.font, 'Autopilot: ', f'{stats["p95_ms"]:.1f}ms p95, {stats["late"]} late',
+                Config.TEXT_COLOR, (10, y)))
+            y += 30
+        
+        if self.dropped_ticks:
+            dropped_text = self.text_cache.render(self.font, f'Behind: {self.dropped_ticks} ticks dropped',
+                                                  Config.TEXT_COLOR)
+            hud_rect.union_ip(self.screen.blit(dropped_text, (10, y)))
+        
+        return hud_rect
     
-    def draw_pause_menu(self):
-        # Semi-transparent overlay
-        overlay = pygame.Surface((Config.SCREEN_WIDTH, Config.SCREEN_HEIGHT), pygame.SRCALPHA)
-        overlay.fill((0, 0, 0, 128))
-        self.screen.blit(overlay, (0, 0))
+    def draw_cell(self, cell):
+        value = self.engine.grid[cell[1] * self.engine.cols + cell[0]]
+        if value == SNAKE:
+            color = Config.SNAKE_COLOR
+        elif value == OBSTACLE:
+            color = Config.OBSTACLE_COLOR
+        elif cell == self.engine.food:
+            color = Config.FOOD_COLOR
+        else:
+            color = Config.BG_COLOR
+        return self.screen.fill(color, self.cell_rect(cell))
+    
+    def draw_cells_under(self, rect):
+        left = max(0, rect.left // Config.GRID_SIZE)
+        right = min(Config.GRID_COLS, (rect.right - 1) // Config.GRID_SIZE + 1)
+        top = max(0, rect.top // Config.GRID_SIZE)
+        bottom = min(Config.GRID_ROWS, (rect.bottom - 1) // Config.GRID_SIZE + 1)
+        for y in range(top, bottom):
+            for x in range(left, right):
+                self.draw_cell((x + self.camera[0], y + self.camera[1]))
+    
+    # Clears a screen area and draws back the cells under it
+    def restore_under(self, rect):
+        self.screen.blit(self.layers['board'][1], rect, rect)
+        self.draw_cells_under(rect)
+    
+    # Points to food outside the view with a small square on the view's edge
+    def draw_food_marker(self):
+        food = self.engine.food
+        if not food:
+            return None
+        x = food[0] - self.camera[0]
+        y = food[1] - self.camera[1]
+        if 0 <= x < Config.GRID_COLS and 0 <= y < Config.GRID_ROWS:
+            return None
+        x = min(max(x, 0), Config.GRID_COLS - 1)
+        y = min(max(y, 0), Config.GRID_ROWS - 1)
+        size = Config.GRID_SIZE // 2
+        return self.screen.fill(Config.FOOD_COLOR, (x * Config.GRID_SIZE + size // 2,
+                                                    y * Config.GRID_SIZE + size // 2, size, size))
+    
+    # Repaints the cells touched since the last frame and the HUD, and returns
+    # the screen areas that need to be pushed to the display
+    def draw_game_dirty(self):
+        rects = [self.draw_cell(cell) for cell in self.dirty_cells]
+        self.dirty_cells = []
         
-        # Pause text
-        pause_text = self.big_font.render('GAME PAUSED', True, (255, 255, 0))
-        self.screen.blit(pause_text, 
-                       (Config.SCREEN_WIDTH // 2 - pause_text.get_width() // 2, 
-                        Config.SCREEN_HEIGHT // 2 - 150))
+        # Clear everything drawn over the cells last frame (the food marker,
+        # the HUD text and the profiler) and restore the cells under it
+        old_rects = [rect for rect in (self.marker_rect, self.hud_rect, self.profiler_rect) if rect]
+        for rect in old_rects:
+            self.restore_under(rect)
+        
+        # Then draw them again in the same order as a full redraw
+        self.marker_rect = self.draw_food_marker()
+        self.hud_rect = self.draw_hud()
+        self.profiler_rect = self.draw_profiler()
+        rects += old_rects
+        rects += [rect for rect in (self.marker_rect, self.hud_rect, self.profiler_rect) if rect]
+        return rects
+    
+    # Frame time table next to the HUD, toggled with F3 when running with --profile
+    def draw_profiler(self):
+        if self.profiler is None or not self.profiler.visible:
+            return None
+        return self.profiler.draw(self.screen, (Config.SCREEN_WIDTH // 2, 10))
+    
+    def cell_rect(self, cell):
+        return cell_rect(cell, self.camera)
+    
+    def draw_countdown(self):
+        remaining = max(1, math.ceil(self.countdown_end - time.time()))
+        countdown_text = self.text_cache.render(self.big_font, str(remaining), (255, 0, 0))
+        self.screen.blit(countdown_text, 
+                       (Config.SCREEN_WIDTH // 2 - countdown_text.get_width() // 2, 
+                        Config.SCREEN_HEIGHT // 2 - countdown_text.get_height() // 2))
+    
+    # Nothing under the menu moves while paused, so the shaded game is drawn
+    # once per pause and only the buttons are drawn every frame
+    def draw_pause_menu(self):
+        self.compose('screen', ('paused', self.engine, self.engine.ticks, self.pause_time), self.draw_paused_game)
         
         # Buttons
         self.continue_button.draw(self.screen)
@@ -646,40 +1081,83 @@ class SnakeGame:
         self.restart_button.draw(self.screen)
         self.menu_button.draw(self.screen)
     
+    def draw_paused_game(self):
+        self.draw_game()
+        self.screen.blit(self.shade, (0, 0))
+        
+        pause_text = self.text_cache.render(self.big_font, 'GAME PAUSED', (255, 255, 0))
+        self.screen.blit(pause_text, 
+                       (Config.SCREEN_WIDTH // 2 - pause_text.get_width() // 2, 
+                        Config.SCREEN_HEIGHT // 2 - 150))
+    
     def draw_game_over(self):
-        # Semi-transparent overlay
-        overlay = pygame.Surface((Config.SCREEN_WIDTH, Config.SCREEN_HEIGHT), pygame.SRCALPHA)
-        overlay.fill((0, 0, 0, 128))
-        self.screen.blit(overlay, (0, 0))
+        key = ('over', self.engine, self.engine.ticks, self.end_time, self.remote is not None)
+        self.compose('screen', key, self.draw_game_over_text)
+    
+    def draw_game_over_text(self):
+        self.screen.blit(self.shade, (0, 0))
         
-        game_over = self.big_font.render('GAME OVER', True, (255, 0, 0))
+        game_over = self.text_cache.render(self.big_font, 'GAME OVER', (255, 0, 0))
         self.screen.blit(game_over, (Config.SCREEN_WIDTH // 2 - game_over.get_width() // 2, 150))
         
         time_played = self.end_time - self.start_time - self.total_pause_time
         stats = [
-            f'Final Score: {self.score}',
+            f'Final Score: {self.engine.score}',
             f'Time Played: {time_played:.1f}s',
             f'Mode: {"Speedrun" if self.in_speedrun else self.difficulty}',
-            f'Speed: {self.speed}',
+            f'Speed: {self.engine.speed}',
             '',
-            'Press R to return to menu'
+            'Press R to play again' if self.remote else 'Press R to return to menu'
         ]
         
         y_offset = 220
         for stat in stats:
-            stat_text = self.font.render(stat, True, Config.TEXT_COLOR)
+            stat_text = self.text_cache.render(self.font, stat, Config.TEXT_COLOR)
             self.screen.blit(stat_text, (Config.SCREEN_WIDTH // 2 - stat_text.get_width() // 2, y_offset))
             y_offset += 40
     
     def run(self):
         running = True
         while running:
+            # Rendering is capped at FPS, update() runs the ticks that are due
+            dt = self.clock.tick(Config.FPS) / 1000.0
+            if self.profiler:
+                self.profiler.begin_frame()
             running = self.handle_events()
-            self.update()
+            if not running:
+                break
+            self.update(dt)
             self.draw()
-            self.clock.tick(self.speed if self.game_started and not self.paused else 60)
+            if self.profiler:
+                self.profiler.end_frame()
+        self.autopilot.close()
+        self.history_store.close()
 
 # Run the game
 if __name__ == '__main__':
-    game = SnakeGame()
-    game.run()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Snake Game")
+    parser.add_argument("--replay", help="watch a recorded .snkr game")
+    parser.add_argument("--replay-speed", type=int, help="ticks per second for --replay, defaults to the recorded speed")
+    parser.add_argument("--world", type=parse_world, metavar="COLSxROWS",
+                        help="play on a world bigger than the window, e.g. 5000x5000")
+    parser.add_argument("--connect", metavar="HOST:PORT", help="play in a snake_server.py room instead of locally")
+    parser.add_argument("--room", type=int, default=0, help="room to join with --connect, joining a busy room watches it")
+    parser.add_argument("--difficulty", choices=["Easy", "Medium", "Hard"], default="Easy", help="for a new --connect room")
+    parser.add_argument("--speed", type=int, default=10, help="for a new --connect room")
+    parser.add_argument("--speedrun", action="store_true", help="for a new --connect room")
+    parser.add_argument("--profile", action="store_true", help="time every frame, F3 shows the stats")
+    parser.add_argument("--profile-trace", help="with --profile, write a Chrome trace JSON here on exit")
+    args = parser.parse_args()
+    
+    profiler = FrameProfiler() if args.profile or args.profile_trace else None
+    game = SnakeGame(profiler, args.world)
+    if args.replay:
+        game.start_replay(Replay.load(args.replay), args.replay_speed)
+    elif args.connect:
+        # asyncio and the rest of the server only load when they're needed
+        from snake_server import RemoteClient
+        host, port = args.connect.rsplit(":", 1)
+        game.start_remote(RemoteClient(host, int(port), args.room, args.difficulty, args.speed, args.speedrun))
+    game.run()
+    if args.profile_trace:
+        profiler.dump_trace(args.profile_trace)
\ No newline at end of file
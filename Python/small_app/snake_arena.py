@@ -0,0 +1,352 @@
+import argparse
+import random
+import time
+from array import array
+from collections import deque
+from snake_config import Config, Direction
+from snake_engine import FreeCells, EMPTY, SNAKE, OBSTACLE
+from snake_rollout import DIRECTIONS, RandomPolicy, greedy_policy
+
+# Side of a food bucket of the spatial hash, in cells
+FOOD_BUCKET = 8
+SPAWN_ATTEMPTS = 100
+# owner value of cells no snake is on
+NO_OWNER = -1
+
+# One snake of the arena. It has the attributes a policy reads from a
+# SnakeEngine (grid, cols, rows, snake, direction, food, ticks, game_over),
+# so greedy_policy, autopilot_policy and friends steer it unchanged. food is
+# the food closest to its head.
+class ArenaSnake:
+    __slots__ = ('id', 'arena', 'cols', 'rows', 'grid', 'snake', 'direction', 'policy', 'ticks',
+                 'game_over', 'score', 'kills', 'deaths', 'target', 'target_tick')
+
+    def __init__(self, arena, snake_id, policy):
+        self.id = snake_id
+        self.arena = arena
+        self.cols = arena.cols
+        self.rows = arena.rows
+        self.grid = arena.grid
+        self.snake = deque()
+        self.direction = Direction.RIGHT
+        self.policy = policy
+        self.ticks = 0
+        self.game_over = True
+        self.score = 0
+        self.kills = 0
+        self.deaths = 0
+        self.target = None
+        self.target_tick = -1
+
+    # Looked up at most once per tick, and only if the policy asks
+    @property
+    def food(self):
+        if self.target_tick != self.arena.ticks:
+            self.target = self.arena.nearest_food(self.snake[0]) if self.snake else None
+            self.target_tick = self.arena.ticks
+        return self.target
+
+# Many snakes on one board, moving at the same time with the rules of
+# SnakeEngine.step: a head dies on the walls, obstacles and any body (tails
+# included, they haven't moved yet), two heads on one cell both die, so a
+# contested food goes to nobody. Collisions are looked up in the shared
+# occupancy grid and a dict of new head cells, never by comparing snakes.
+class ArenaEngine:
+    def __init__(self, cols=200, rows=160, food_count=50, obstacle_count=0, respawn=True, seed=None):
+        self.cols = cols
+        self.rows = rows
+        self.rng = random.Random(seed)
+        size = cols * rows
+        self.grid = bytearray(size)
+        # Which snake is on each cell, to credit kills
+        self.owner = array('i', [NO_OWNER]) * size
+        self.free = FreeCells(range(size), size)
+        self.food_count = food_count
+        self.foods = set()
+        # Spatial hash of the food, bucket -> (x, y) of the food in it
+        self.food_buckets = {}
+        self.respawn = respawn
+        self.snakes = []
+        self.ticks = 0
+        for _ in range(obstacle_count):
+            if self.free:
+                index = self.free.sample(self.rng)
+                self.grid[index] = OBSTACLE
+                self.free.remove(index)
+        self.refill_food()
+
+    def add_snake(self, policy=greedy_policy):
+        snake = ArenaSnake(self, len(self.snakes), policy)
+        self.snakes.append(snake)
+        self.spawn(snake)
+        return snake
+
+    # Puts a dead snake back as three cells in a row in a random free spot
+    def spawn(self, snake):
+        cols = self.cols
+        for _ in range(SPAWN_ATTEMPTS):
+            if not self.free:
+                return False
+            head = self.free.sample(self.rng)
+            dx, dy = self.rng.choice(DIRECTIONS)
+            x = head % cols
+            y = head // cols
+            cells = [(x - i * dx, y - i * dy) for i in range(3)]
+            if all(0 <= cx < cols and 0 <= cy < self.rows and (cy * cols + cx) in self.free for cx, cy in cells):
+                snake.snake = deque(cells)
+                for cx, cy in cells:
+                    self.occupy(cy * cols + cx, snake.id)
+                snake.direction = (dx, dy)
+                snake.game_over = False
+                snake.ticks = self.ticks
+                return True
+        return False
+
+    def occupy(self, index, owner):
+        self.grid[index] = SNAKE
+        self.owner[index] = owner
+        self.free.remove(index)
+
+    def release(self, index):
+        self.grid[index] = EMPTY
+        self.owner[index] = NO_OWNER
+        self.free.add(index)
+
+    def add_food(self, index):
+        x = index % self.cols
+        y = index // self.cols
+        self.free.remove(index)
+        self.foods.add(index)
+        self.food_buckets.setdefault((x // FOOD_BUCKET, y // FOOD_BUCKET), set()).add((x, y))
+
+    def remove_food(self, index):
+        x = index % self.cols
+        y = index // self.cols
+        self.foods.discard(index)
+        key = (x // FOOD_BUCKET, y // FOOD_BUCKET)
+        bucket = self.food_buckets[key]
+        bucket.discard((x, y))
+        if not bucket:
+            del self.food_buckets[key]
+
+    def refill_food(self):
+        while len(self.foods) < self.food_count and self.free:
+            self.add_food(self.free.sample(self.rng))
+
+    # Searches the food buckets in growing squares around the head, until
+    # the next square is further away than the best food found
+    def nearest_food(self, head):
+        if not self.foods:
+            return None
+        head_x, head_y = head
+        bx = head_x // FOOD_BUCKET
+        by = head_y // FOOD_BUCKET
+        reach = max(self.cols, self.rows) // FOOD_BUCKET + 1
+        buckets = self.food_buckets
+        best = None
+        best_distance = reach * FOOD_BUCKET * 2
+        radius = 0
+        while radius <= reach:
+            for key in self.ring(bx, by, radius):
+                bucket = buckets.get(key)
+                if bucket:
+                    for food in bucket:
+                        distance = abs(food[0] - head_x) + abs(food[1] - head_y)
+                        if distance < best_distance:
+                            best_distance = distance
+                            best = food
+            # Cells of the next square are at least this far
+            if best is not None and best_distance <= radius * FOOD_BUCKET:
+                break
+            radius += 1
+        return best
+
+    def ring(self, bx, by, radius):
+        if radius == 0:
+            return [(bx, by)]
+        keys = [(x, by - radius) for x in range(bx - radius, bx + radius + 1)]
+        keys += [(x, by + radius) for x in range(bx - radius, bx + radius + 1)]
+        keys += [(bx - radius, y) for y in range(by - radius + 1, by + radius)]
+        keys += [(bx + radius, y) for y in range(by - radius + 1, by + radius)]
+        return keys
+
+    # Asks every live snake's policy for its move, {id: direction}
+    def decide(self):
+        return {snake.id: snake.policy(snake) for snake in self.snakes if not snake.game_over}
+
+    # Moves every live snake one cell. actions maps snake ids to directions,
+    # snakes without one ask their policy. Returns the snakes that died.
+    def step(self, actions=None):
+        if actions is None:
+            actions = self.decide()
+        self.ticks += 1
+        cols = self.cols
+        rows = self.rows
+        grid = self.grid
+        moves = []
+        heads = {}
+        dead = []
+
+        for snake in self.snakes:
+            if snake.game_over:
+                continue
+            action = actions[snake.id] if snake.id in actions else snake.policy(snake)
+            if action is not None and (action[0] != -snake.direction[0] or action[1] != -snake.direction[1]):
+                snake.direction = action
+            snake.ticks += 1
+            x = snake.snake[0][0] + snake.direction[0]
+            y = snake.snake[0][1] + snake.direction[1]
+            index = y * cols + x
+            if x < 0 or x >= cols or y < 0 or y >= rows:
+                dead.append(snake)
+            elif grid[index] != EMPTY:
+                owner = self.owner[index]
+                if owner != NO_OWNER and owner != snake.id:
+                    self.snakes[owner].kills += 1
+                dead.append(snake)
+            else:
+                moves.append((snake, x, y, index))
+                heads[index] = heads.get(index, 0) + 1
+
+        for snake, x, y, index in moves:
+            if heads[index] > 1:
+                dead.append(snake)
+                continue
+            snake.snake.appendleft((x, y))
+            self.occupy(index, snake.id)
+            if index in self.foods:
+                self.remove_food(index)
+                snake.score += 1
+            else:
+                tail_x, tail_y = snake.snake.pop()
+                self.release(tail_y * cols + tail_x)
+
+        for snake in dead:
+            for x, y in snake.snake:
+                self.release(y * cols + x)
+            snake.snake.clear()
+            snake.game_over = True
+            snake.deaths += 1
+
+        self.refill_food()
+        if self.respawn:
+            for snake in self.snakes:
+                if snake.game_over:
+                    self.spawn(snake)
+        return dead
+
+    def alive(self):
+        return sum(1 for snake in self.snakes if not snake.game_over)
+
+# Tick time against the number of snakes. Deciding (the policies) and
+# resolving the moves are timed apart, the second is the arena itself.
+def bench(args):
+    print(f"{'snakes':>7} {'board':>9} {'decide ms':>10} {'resolve ms':>11} {'p95 ms':>8} {'alive':>6}")
+    for count in (int(n) for n in args.snakes.split(",")):
+        side = args.side or max(100, int((count * 80) ** 0.5))
+        arena = ArenaEngine(side, side, food_count=count, obstacle_count=side * side // 200, seed=args.seed)
+        for _ in range(count):
+            arena.add_snake(greedy_policy)
+        for _ in range(args.warmup):
+            arena.step()
+        decide = []
+        resolve = []
+        for _ in range(args.ticks):
+            start = time.perf_counter()
+            actions = arena.decide()
+            middle = time.perf_counter()
+            arena.step(actions)
+            resolve.append(time.perf_counter() - middle)
+            decide.append(middle - start)
+        ordered = sorted(resolve)
+        print(f"{count:7} {side:4}x{side:<4} {sum(decide) / len(decide) * 1000:10.2f} "
+              f"{sum(resolve) / len(resolve) * 1000:11.2f} {ordered[int(0.95 * len(ordered))] * 1000:8.2f} "
+              f"{arena.alive():6}")
+
+# The player steers snake 0 with the arrow keys, the rest are bots
+def play(args):
+    import pygame
+    from snake_autopilot import Autopilot
+    from snake_text import get_font
+
+    pygame.display.init()
+    cell = max(1, min(Config.SCREEN_WIDTH // args.cols, Config.SCREEN_HEIGHT // args.rows))
+    screen = pygame.display.set_mode((args.cols * cell, args.rows * cell))
+    pygame.display.set_caption('Snake Arena')
+    font = get_font('Arial', 18)
+    clock = pygame.time.Clock()
+
+    arena = ArenaEngine(args.cols, args.rows, food_count=args.food, obstacle_count=args.obstacles, seed=args.seed)
+    turns = deque()
+    player = arena.add_snake(lambda snake: turns.popleft() if turns else None)
+    autopilots = [Autopilot(threaded=False) for _ in range(args.autopilots)]
+    for autopilot in autopilots:
+        arena.add_snake(autopilot.next_direction)
+    random_policy = RandomPolicy(args.seed)
+    for i in range(args.snakes - 1 - len(autopilots)):
+        arena.add_snake(random_policy if i % 10 == 9 else greedy_policy)
+    # One color per snake, the player in the usual snake color
+    colors = [Config.SNAKE_COLOR] + [pygame.Color(0) for _ in arena.snakes[1:]]
+    for i, color in enumerate(colors[1:], 1):
+        color.hsva = (i * 47 % 360, 70, 90, 100)
+
+    keys = {K: d for K, d in ((pygame.K_UP, Direction.UP), (pygame.K_DOWN, Direction.DOWN),
+                              (pygame.K_LEFT, Direction.LEFT), (pygame.K_RIGHT, Direction.RIGHT))}
+    obstacles = [(index % arena.cols * cell, index // arena.cols * cell, cell, cell)
+                 for index in range(len(arena.grid)) if arena.grid[index] == OBSTACLE]
+    accumulator = 0.0
+    tick_ms = 0.0
+    running = True
+    while running:
+        accumulator += clock.tick(Config.FPS) / 1000.0
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                running = False
+            elif event.type == pygame.KEYDOWN and event.key in keys and len(turns) < Config.INPUT_QUEUE_SIZE:
+                turns.append(keys[event.key])
+        while accumulator >= 1.0 / args.speed:
+            accumulator -= 1.0 / args.speed
+            start = time.perf_counter()
+            arena.step()
+            tick_ms = (time.perf_counter() - start) * 1000
+
+        screen.fill(Config.BG_COLOR)
+        for rect in obstacles:
+            screen.fill(Config.OBSTACLE_COLOR, rect)
+        for index in arena.foods:
+            screen.fill(Config.FOOD_COLOR, (index % arena.cols * cell, index // arena.cols * cell, cell, cell))
+        for snake, color in zip(arena.snakes, colors):
+            for x, y in snake.snake:
+                screen.fill(color, (x * cell, y * cell, cell, cell))
+        hud = f"Score: {player.score}  Kills: {player.kills}  Deaths: {player.deaths}  " \
+              f"Alive: {arena.alive()}/{len(arena.snakes)}  Tick: {tick_ms:.2f}ms"
+        screen.blit(font.render(hud, True, Config.TEXT_COLOR), (10, 10))
+        pygame.display.flip()
+    pygame.quit()
+
+def main():
+    parser = argparse.ArgumentParser(description="Many snakes on one board")
+    commands = parser.add_subparsers(dest="command", required=True)
+    bench_parser = commands.add_parser("bench", help="report tick time against the number of snakes")
+    bench_parser.add_argument("--snakes", default="10,50,100,250,500", help="comma separated snake counts")
+    bench_parser.add_argument("--side", type=int, default=None, help="board side, by default grows with the snakes")
+    bench_parser.add_argument("--ticks", type=int, default=200)
+    bench_parser.add_argument("--warmup", type=int, default=50)
+    bench_parser.add_argument("--seed", type=int, default=0)
+    play_parser = commands.add_parser("play", help="play snake 0 with the arrow keys against bots")
+    play_parser.add_argument("--snakes", type=int, default=30)
+    play_parser.add_argument("--autopilots", type=int, default=2, help="bots that plan with the autopilot")
+    play_parser.add_argument("--cols", type=int, default=100)
+    play_parser.add_argument("--rows", type=int, default=80)
+    play_parser.add_argument("--food", type=int, default=30)
+    play_parser.add_argument("--obstacles", type=int, default=40)
+    play_parser.add_argument("--speed", type=int, default=10)
+    play_parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    if args.command == "bench":
+        bench(args)
+    else:
+        play(args)
+
+if __name__ == '__main__':
+    main()
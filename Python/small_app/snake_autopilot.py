@@ -0,0 +1,352 @@
+import argparse
+import heapq
+import threading
+import time
+from array import array
+from collections import deque
+from snake_config import Direction
+from snake_engine import SnakeEngine, EMPTY, OBSTACLE
+
+DIRECTIONS = (Direction.UP, Direction.DOWN, Direction.LEFT, Direction.RIGHT)
+# Steps of the cycle planned at once when falling back to it
+CYCLE_STEPS = 40
+
+# Successor of every cell on a Hamiltonian cycle of the board, or None when
+# both sides are odd and there is no cycle. Rows zigzag over columns 1.. and
+# column 0 leads back up (or the same turned sideways when only cols is even).
+def hamiltonian_cycle(cols, rows):
+    if rows % 2 == 0:
+        path = []
+        for y in range(rows):
+            xs = range(1, cols) if y % 2 == 0 else range(cols - 1, 0, -1)
+            path += [y * cols + x for x in xs]
+        path += [y * cols for y in range(rows - 1, -1, -1)]
+    elif cols % 2 == 0:
+        path = []
+        for x in range(cols):
+            ys = range(1, rows) if x % 2 == 0 else range(rows - 1, 0, -1)
+            path += [y * cols + x for y in ys]
+        path += [x for x in range(cols - 1, -1, -1)]
+    else:
+        return None
+    succ = array('i', [0]) * (cols * rows)
+    for i, cell in enumerate(path):
+        succ[cell] = path[(i + 1) % len(path)]
+    return succ
+
+# What the planner needs from the engine, copied so the worker thread never
+# reads the engine while the game loop changes it
+class Snapshot:
+    def __init__(self, engine):
+        self.tick = engine.ticks
+        self.body = [y * engine.cols + x for x, y in engine.snake]
+        self.food = None if engine.food is None else engine.food[1] * engine.cols + engine.food[0]
+        self.grid = bytes(engine.grid)
+
+# Plans on a Snapshot. A body segment j cells behind the head is gone after
+# len(body) - j steps, so paths may run through the body where it will have
+# moved on by the time the head gets there.
+class PathPlanner:
+    def __init__(self, cols, rows):
+        self.cols = cols
+        self.rows = rows
+        self.cycle = hamiltonian_cycle(cols, rows)
+        self.adjacent = []
+        for index in range(cols * rows):
+            x = index % cols
+            y = index // cols
+            self.adjacent.append([index + dx + dy * cols for dx, dy in DIRECTIONS
+                                  if 0 <= x + dx < cols and 0 <= y + dy < rows])
+
+    # True if cell is taken when the head steps onto it at step `step`
+    def blocked(self, grid, order, length, cell, step):
+        if grid[cell] == OBSTACLE:
+            return True
+        j = order.get(cell)
+        return j is not None and j <= length - step
+
+    # Shortest path from body[0] to any of `goals`, as a list of cells
+    # starting at the head. The heuristic aims at `target` when given.
+    def astar(self, grid, body, goals, target=None):
+        order = {cell: j for j, cell in enumerate(body)}
+        length = len(body)
+        start = body[0]
+        cols = self.cols
+        if target is not None:
+            tx = target % cols
+            ty = target // cols
+            h = lambda cell: abs(cell % cols - tx) + abs(cell // cols - ty)
+        else:
+            h = lambda cell: 0
+        came_from = {start: None}
+        best = {start: 0}
+        heap = [(h(start), 0, start)]
+        while heap:
+            _, g, cell = heapq.heappop(heap)
+            if g != best[cell]:
+                continue
+            if cell in goals and cell != start:
+                path = [cell]
+                while came_from[path[-1]] is not None:
+                    path.append(came_from[path[-1]])
+                return path[::-1]
+            for neighbour in self.adjacent[cell]:
+                step = g + 1
+                if step < best.get(neighbour, step + 1) and not self.blocked(grid, order, length, neighbour, step):
+                    best[neighbour] = step
+                    came_from[neighbour] = cell
+                    heapq.heappush(heap, (step + h(neighbour), step, neighbour))
+        return None
+
+    # Body after following path (path[0] is the current head), growing by
+    # one if the path ends on the food
+    def body_after(self, snapshot, path):
+        length = len(snapshot.body) + (1 if path[-1] == snapshot.food else 0)
+        return (path[:0:-1] + snapshot.body)[:length]
+
+    # Tail-chasing check: after the path, can the head still reach the tail?
+    # As long as it can, the snake can follow its tail and never gets trapped.
+    def safe(self, snapshot, path):
+        body = self.body_after(snapshot, path)
+        return self.astar(snapshot.grid, body, {body[-1]}) is not None
+
+    # Valid if every step lands on a cell that is free by then
+    def valid(self, snapshot, path):
+        order = {cell: j for j, cell in enumerate(snapshot.body)}
+        length = len(snapshot.body)
+        for step in range(1, len(path)):
+            if (path[step] not in self.adjacent[path[step - 1]] or
+                    self.blocked(snapshot.grid, order, length, path[step], step)):
+                return False
+        return True
+
+    # The next steps along the Hamiltonian cycle that are free, ending early
+    # on the food since eating changes the timing of the body
+    def follow_cycle(self, snapshot):
+        if self.cycle is None:
+            return None
+        order = {cell: j for j, cell in enumerate(snapshot.body)}
+        length = len(snapshot.body)
+        path = [snapshot.body[0]]
+        for step in range(1, CYCLE_STEPS + 1):
+            cell = self.cycle[path[-1]]
+            if self.blocked(snapshot.grid, order, length, cell, step):
+                break
+            path.append(cell)
+            if cell == snapshot.food:
+                break
+        return path if len(path) > 1 else None
+
+    # Reuses what still works of the previous plan: path from the head back
+    # onto a later cell of it, then the rest of the old plan
+    def repair(self, snapshot, previous):
+        rest = previous[1:]
+        if not rest or rest[-1] != snapshot.food:
+            return None
+        goals = set(rest)
+        detour = self.astar(snapshot.grid, snapshot.body, goals, snapshot.food)
+        if detour is None:
+            return None
+        path = detour + rest[rest.index(detour[-1]) + 1:]
+        if self.valid(snapshot, path) and self.safe(snapshot, path):
+            return path
+        return None
+
+    # Returns (path, kind). path[0] is the head, kind says which rule found it.
+    def plan(self, snapshot, previous=None):
+        if snapshot.food is not None:
+            if previous:
+                path = self.repair(snapshot, previous)
+                if path:
+                    return path, "repair"
+            path = self.astar(snapshot.grid, snapshot.body, {snapshot.food}, snapshot.food)
+            if path and self.safe(snapshot, path):
+                return path, "astar"
+
+        path = self.follow_cycle(snapshot)
+        if path:
+            if self.safe(snapshot, path):
+                return path, "cycle"
+            if self.safe(snapshot, path[:2]):
+                return path[:2], "cycle"
+
+        # Chase the tail and try again once it has moved
+        tail = snapshot.body[-1]
+        path = self.astar(snapshot.grid, snapshot.body, {tail})
+        if path:
+            return path, "tail"
+
+        # Trapped, take any free cell and hope
+        order = {cell: j for j, cell in enumerate(snapshot.body)}
+        for cell in self.adjacent[snapshot.body[0]]:
+            if not self.blocked(snapshot.grid, order, len(snapshot.body), cell, 1):
+                return [snapshot.body[0], cell], "desperate"
+        return None, "stuck"
+
+# Plays for the player. Plans are made on a worker thread from a snapshot
+# taken after a tick and cover many ticks ahead, so the game loop only checks
+# the next cell of the cached plan. When no plan is ready in time it takes a
+# quick safe move instead of waiting, and counts it as late.
+class Autopilot:
+    def __init__(self, threaded=True):
+        self.threaded = threaded
+        self.planner = None
+        self.lock = threading.Condition()
+        self.request = None
+        self.plan = None  # (tick, cells)
+        self.closed = False
+        self.latencies = deque(maxlen=600)
+        self.counts = {}
+        self.late = 0
+        self.thread = None
+        if threaded:
+            self.thread = threading.Thread(target=self._work, name="autopilot", daemon=True)
+            self.thread.start()
+
+    def reset(self):
+        with self.lock:
+            self.request = None
+            self.plan = None
+        self.latencies.clear()
+        self.counts = {}
+        self.late = 0
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.lock.notify()
+        if self.thread is not None:
+            self.thread.join()
+
+    def _planner_for(self, cols, rows):
+        if self.planner is None or (self.planner.cols, self.planner.rows) != (cols, rows):
+            self.planner = PathPlanner(cols, rows)
+        return self.planner
+
+    def _make_plan(self, snapshot, planner, previous):
+        start = time.perf_counter()
+        cells, kind = planner.plan(snapshot, previous)
+        self.latencies.append(time.perf_counter() - start)
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+        return (snapshot.tick, cells) if cells else None
+
+    def _work(self):
+        while True:
+            with self.lock:
+                while self.request is None and not self.closed:
+                    self.lock.wait()
+                if self.closed:
+                    return
+                snapshot, planner = self.request
+                self.request = None
+                previous = self.remaining(self.plan, snapshot.tick)
+            plan = self._make_plan(snapshot, planner, previous)
+            with self.lock:
+                # Kept even if the game has moved on meanwhile: the head may
+                # still be on it, and if not the next plan repairs it
+                self.plan = plan
+
+    # Cells of plan from the given tick on
+    def remaining(self, plan, tick):
+        if plan is None:
+            return None
+        i = tick - plan[0]
+        return plan[1][i:] if 0 <= i < len(plan[1]) else None
+
+    def _cached_next(self, engine):
+        plan = self.plan
+        if plan is None:
+            return None
+        cells = plan[1]
+        i = engine.ticks - plan[0]
+        head = engine.snake[0][1] * engine.cols + engine.snake[0][0]
+        if 0 <= i < len(cells) - 1 and cells[i] == head and engine.grid[cells[i + 1]] == EMPTY:
+            return cells[i + 1]
+        return None
+
+    # Call after every tick: asks for a new plan when the cached one is used up
+    def after_tick(self, engine):
+        if engine.game_over or self._cached_next(engine) is not None:
+            return
+        planner = self._planner_for(engine.cols, engine.rows)
+        if self.threaded:
+            with self.lock:
+                self.request = (Snapshot(engine), planner)
+                self.lock.notify()
+        else:
+            snapshot = Snapshot(engine)
+            self.plan = self._make_plan(snapshot, planner, self.remaining(self.plan, snapshot.tick))
+
+    def next_direction(self, engine):
+        with self.lock:
+            cell = self._cached_next(engine)
+        if cell is None and not self.threaded:
+            self.after_tick(engine)
+            cell = self._cached_next(engine)
+        if cell is None:
+            self.late += 1
+            return quick_move(engine)
+        head_x, head_y = engine.snake[0]
+        return (cell % engine.cols - head_x, cell // engine.cols - head_y)
+
+    def stats(self):
+        ordered = sorted(self.latencies)
+        pick = lambda p: ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000 if ordered else 0.0
+        return {"p50_ms": pick(0.5), "p95_ms": pick(0.95), "max_ms": ordered[-1] * 1000 if ordered else 0.0,
+                "late": self.late, "plans": dict(self.counts)}
+
+# Free move closest to the food, for ticks where no plan is ready
+def quick_move(engine):
+    head_x, head_y = engine.snake[0]
+    best = None
+    for d in DIRECTIONS:
+        if d[0] == -engine.direction[0] and d[1] == -engine.direction[1]:
+            continue
+        x = head_x + d[0]
+        y = head_y + d[1]
+        if 0 <= x < engine.cols and 0 <= y < engine.rows and engine.grid[y * engine.cols + x] == EMPTY:
+            distance = abs(x - engine.food[0]) + abs(y - engine.food[1]) if engine.food else 0
+            if best is None or distance < best[0]:
+                best = (distance, d)
+    return best[1] if best else engine.direction
+
+_shared = None
+_shared_engine = None
+
+# Rollout policy: plans synchronously, one Autopilot per process. It starts
+# over on every new game, so no plan or stats carry over from the last one.
+def autopilot_policy(engine):
+    global _shared, _shared_engine
+    if _shared is None:
+        _shared = Autopilot(threaded=False)
+    if engine is not _shared_engine or engine.ticks == 0:
+        _shared.reset()
+        _shared_engine = engine
+    return _shared.next_direction(engine)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the autopilot headless and report scores and planning latency")
+    parser.add_argument("--games", type=int, default=10)
+    parser.add_argument("--difficulty", choices=["Easy", "Medium", "Hard"], default="Easy")
+    parser.add_argument("--speedrun", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-ticks", type=int, default=20000)
+    args = parser.parse_args()
+
+    pilot = Autopilot(threaded=False)
+    engine = SnakeEngine()
+    start = time.perf_counter()
+    ticks = 0
+    for game in range(args.games):
+        engine.reset(None if args.speedrun else args.difficulty, 5, args.speedrun, args.seed + game)
+        while not engine.game_over and engine.ticks < args.max_ticks:
+            engine.step(pilot.next_direction(engine))
+        ticks += engine.ticks
+        print(f"game {game}: score {engine.score}, ticks {engine.ticks}")
+    elapsed = time.perf_counter() - start
+    stats = pilot.stats()
+    print(f"{ticks / elapsed:.0f} ticks/s, planning p50 {stats['p50_ms']:.2f}ms p95 {stats['p95_ms']:.2f}ms "
+          f"max {stats['max_ms']:.2f}ms, plans {stats['plans']}")
+
+if __name__ == '__main__':
+    main()
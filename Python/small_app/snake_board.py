@@ -0,0 +1,44 @@
+from snake_config import Config
+from snake_engine import SNAKE, OBSTACLE
+
+# Board drawing shared by the game window and offscreen frames. The view is
+# GRID_COLS x GRID_ROWS cells with its top left cell at camera, each cell
+# size pixels square.
+
+def cell_rect(cell, camera, size=Config.GRID_SIZE):
+    return ((cell[0] - camera[0]) * size, (cell[1] - camera[1]) * size, size, size)
+
+# Scrolls just enough to keep the head CAMERA_MARGIN cells inside the view,
+# or centers the view on it. Returns the new camera.
+def follow_head(engine, camera, center=False):
+    x, y = engine.snake[0]
+    left, top = camera
+    margin = Config.CAMERA_MARGIN
+    if center:
+        left = x - Config.GRID_COLS // 2
+        top = y - Config.GRID_ROWS // 2
+    else:
+        left = min(max(left, x + margin + 1 - Config.GRID_COLS), x - margin)
+        top = min(max(top, y + margin + 1 - Config.GRID_ROWS), y - margin)
+    left = max(0, min(left, engine.cols - Config.GRID_COLS))
+    top = max(0, min(top, engine.rows - Config.GRID_ROWS))
+    return (left, top)
+
+# What the background and obstacles of a view depend on
+def board_key(engine, camera):
+    return (engine, engine.seed, engine.obstacle_version, camera)
+
+def draw_obstacles(surface, engine, camera, size=Config.GRID_SIZE):
+    left, top = camera
+    for x, y, value in engine.visible(left, top, left + Config.GRID_COLS, top + Config.GRID_ROWS):
+        if value == OBSTACLE:
+            surface.fill(Config.OBSTACLE_COLOR, cell_rect((x, y), camera, size))
+
+# The snake inside the view, nothing else is looked at, then the food
+def draw_pieces(surface, engine, camera, size=Config.GRID_SIZE):
+    left, top = camera
+    for x, y, value in engine.visible(left, top, left + Config.GRID_COLS, top + Config.GRID_ROWS):
+        if value == SNAKE:
+            surface.fill(Config.SNAKE_COLOR, cell_rect((x, y), camera, size))
+    if engine.food:
+        surface.fill(Config.FOOD_COLOR, cell_rect(engine.food, camera, size))
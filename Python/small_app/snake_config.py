@@ -0,0 +1,35 @@
+# Game configuration
+class Config:
+    SCREEN_WIDTH = 1000
+    SCREEN_HEIGHT = 800
+    GRID_SIZE = 20
+    BG_COLOR = (40, 40, 40)
+    SNAKE_COLOR = (0, 255, 0)
+    FOOD_COLOR = (255, 0, 0)
+    OBSTACLE_COLOR = (150, 150, 150)
+    TEXT_COLOR = (255, 255, 255)
+    BUTTON_COLOR = (70, 130, 180)
+    BUTTON_HOVER_COLOR = (100, 160, 210)
+    HISTORY_FILE = "snake_history.json"
+    HISTORY_DB = "snake_history.db"
+    REPLAY_DIR = "replays"
+    INPUT_BOX_COLOR = (230, 230, 230)
+    INPUT_TEXT_COLOR = (0, 0, 0)
+    GRID_COLS = SCREEN_WIDTH // GRID_SIZE
+    GRID_ROWS = SCREEN_HEIGHT // GRID_SIZE
+    # In a world bigger than the window the view scrolls to keep the head this far from its edges
+    CAMERA_MARGIN = 10
+    # Redraw only changed cells and the HUD during play
+    DIRTY_RECTS = True
+    # Render rate cap, the snake moves at its own speed independently
+    FPS = 60
+    # Game time a frame may catch up after a stall, anything older is dropped
+    MAX_CATCH_UP = 0.25
+    INPUT_QUEUE_SIZE = 3
+
+# Directions
+class Direction:
+    UP = (0, -1)
+    DOWN = (0, 1)
+    LEFT = (-1, 0)
+    RIGHT = (1, 0)
@@ -0,0 +1,490 @@
+import random
+import struct
+from array import array
+from collections import deque
+from snake_config import Config, Direction
+
+# Results of SnakeEngine.step
+MOVED = 0
+ATE = 1
+DIED = 2
+
+# Occupancy grid values
+EMPTY = 0
+SNAKE = 1
+OBSTACLE = 2
+
+# Obstacles stay this many cells away from the walls
+OBSTACLE_MARGIN = 3
+# Candidates tried per obstacle before giving up on it
+OBSTACLE_ATTEMPTS = 50
+
+# Undo log entries, see SnakeEngine.snapshot
+UNDO_GRID = 0
+UNDO_FREE_ADD = 1
+UNDO_FREE_REMOVE = 2
+UNDO_HEAD = 3
+UNDO_TAIL = 4
+UNDO_OBSTACLES = 5
+UNDO_RNG = 6
+
+# to_bytes layout: header, then u32 arrays for the snake (head first), the
+# obstacles, both free cell lists in their current order and the RNG state
+STATE_HEADER = struct.Struct('<4sHHQIIIIBBBBiiIIIII')
+STATE_MAGIC = b'SNKS'
+STATE_DIFFICULTIES = (None, "Easy", "Medium", "Hard")
+STATE_DIRECTIONS = (Direction.UP, Direction.DOWN, Direction.LEFT, Direction.RIGHT)
+
+# True if the cells just around a straight piece that pass the passable(x, y)
+# test form a single run. They then stay connected to each other, so any route
+# through the piece can go around it instead and no flood fill is needed.
+def ring_is_connected(cells, cols, passable):
+    left = min(cell % cols for cell in cells) - 1
+    right = max(cell % cols for cell in cells) + 1
+    top = min(cell // cols for cell in cells) - 1
+    bottom = max(cell // cols for cell in cells) + 1
+
+    ring = [(x, top) for x in range(left, right)]
+    ring += [(right, y) for y in range(top, bottom)]
+    ring += [(x, bottom) for x in range(right, left, -1)]
+    ring += [(left, y) for y in range(bottom, top, -1)]
+    open_cells = [passable(x, y) for x, y in ring]
+
+    # Count the places where a run of passable cells starts
+    runs = sum(1 for i in range(len(open_cells)) if open_cells[i] and not open_cells[i - 1])
+    return runs <= 1
+
+# 1 for the cells where obstacles may be placed
+def inner_mask(cols, rows):
+    inner = bytearray(cols * rows)
+    for y in range(OBSTACLE_MARGIN, rows - OBSTACLE_MARGIN):
+        start = y * cols + OBSTACLE_MARGIN
+        end = y * cols + cols - OBSTACLE_MARGIN
+        inner[start:end] = b'\x01' * (end - start)
+    return inner
+
+# Set of cell indexes with O(1) add, remove and uniform sampling
+class FreeCells:
+    __slots__ = ('cells', 'pos')
+
+    def __init__(self, cells, size):
+        self.cells = list(cells)
+        self.pos = array('i', [-1]) * size
+        for i, cell in enumerate(self.cells):
+            self.pos[cell] = i
+
+    def __len__(self):
+        return len(self.cells)
+
+    def __contains__(self, cell):
+        return self.pos[cell] >= 0
+
+    # Returns whether the cell was added
+    def add(self, cell):
+        if self.pos[cell] < 0:
+            self.pos[cell] = len(self.cells)
+            self.cells.append(cell)
+            return True
+        return False
+
+    # Returns the position the cell had, or -1 if it wasn't there
+    def remove(self, cell):
+        i = self.pos[cell]
+        if i >= 0:
+            # Move the last entry into the hole instead of shifting the list
+            last = self.cells.pop()
+            if last != cell:
+                self.cells[i] = last
+                self.pos[last] = i
+            self.pos[cell] = -1
+        return i
+
+    # Exact inverses of add and remove, so the order (and with it what
+    # sample picks) is the same as before
+    def undo_add(self, cell):
+        self.cells.pop()
+        self.pos[cell] = -1
+
+    def undo_remove(self, cell, i):
+        if i == len(self.cells):
+            self.cells.append(cell)
+        else:
+            moved = self.cells[i]
+            self.pos[moved] = len(self.cells)
+            self.cells.append(moved)
+            self.cells[i] = cell
+        self.pos[cell] = i
+
+    def copy(self):
+        other = FreeCells.__new__(FreeCells)
+        other.cells = self.cells[:]
+        other.pos = array('i', self.pos)
+        return other
+
+    def sample(self, rng):
+        return self.cells[int(rng.random() * len(self.cells))]
+
+# Headless game rules, no pygame needed. Boards stored some other way (see
+# WorldEngine) build on this rather than on SnakeEngine.
+class BoardEngine:
+    __slots__ = ('cols', 'rows', 'inner', 'seed', 'rng', 'grid', 'free', 'free_inner', 'snake',
+                 'direction', 'difficulty', 'speed', 'speedrun', 'score', 'food_count', 'ticks',
+                 'game_over', 'vacated', 'obstacle_version', 'obstacles', 'food', 'log')
+
+    def __init__(self, cols=Config.GRID_COLS, rows=Config.GRID_ROWS):
+        self.cols = cols
+        self.rows = rows
+        self.inner = inner_mask(cols, rows)
+        self.reset()
+
+    # Every game gets its own RNG so it can be replayed from the seed
+    def reset(self, difficulty=None, speed=1, speedrun=False, seed=None):
+        if seed is None:
+            seed = random.getrandbits(64)
+        # Snapshots don't survive a new game
+        self.log = None
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.new_board()
+
+        head_x = self.cols // 2
+        head_y = self.rows // 2
+        self.snake = deque([(head_x, head_y), (head_x - 1, head_y), (head_x - 2, head_y)])
+        for x, y in self.snake:
+            self.occupy(y * self.cols + x, SNAKE)
+        self.direction = Direction.RIGHT
+        self.difficulty = difficulty
+        self.speed = speed
+        self.speedrun = speedrun
+        self.score = 0
+        self.food_count = 0
+        self.ticks = 0
+        self.game_over = False
+        # Cell the tail left on the last step, for partial redraws
+        self.vacated = None
+        # Bumped whenever the obstacle layout changes
+        self.obstacle_version = 0
+        self.obstacles = []
+        self.food = self.generate_food()
+
+        if not speedrun:
+            if difficulty == "Medium":
+                self.generate_obstacles(5)
+            elif difficulty == "Hard":
+                self.generate_obstacles(10)
+
+    def new_board(self):
+        size = self.cols * self.rows
+        # One byte per cell so collision checks don't scan the body
+        self.grid = bytearray(size)
+        # Cells that are not snake, obstacle or food
+        self.free = FreeCells(range(size), size)
+        self.free_inner = FreeCells([i for i in range(size) if self.inner[i]], size)
+
+    def occupy(self, index, value):
+        if self.log is not None:
+            self.log.append((UNDO_GRID, index, self.grid[index]))
+        self.grid[index] = value
+        self.take(index)
+
+    def release(self, index):
+        log = self.log
+        if log is not None:
+            log.append((UNDO_GRID, index, self.grid[index]))
+        self.grid[index] = EMPTY
+        if self.free.add(index) and log is not None:
+            log.append((UNDO_FREE_ADD, self.free, index))
+        if self.inner[index] and self.free_inner.add(index) and log is not None:
+            log.append((UNDO_FREE_ADD, self.free_inner, index))
+
+    # Drops a cell from both free lists
+    def take(self, index):
+        i = self.free.remove(index)
+        j = self.free_inner.remove(index)
+        if self.log is not None:
+            if i >= 0:
+                self.log.append((UNDO_FREE_REMOVE, self.free, index, i))
+            if j >= 0:
+                self.log.append((UNDO_FREE_REMOVE, self.free_inner, index, j))
+
+    def generate_food(self):
+        # The board is full, nothing left to eat
+        if not self.free:
+            return None
+        if self.log is not None:
+            self.log.append((UNDO_RNG, self.rng.getstate()))
+        index = self.free.sample(self.rng)
+        self.take(index)
+        return (index % self.cols, index // self.cols)
+
+    def generate_obstacles(self, count):
+        if self.log is not None:
+            self.log.append((UNDO_RNG, self.rng.getstate()))
+            self.log.append((UNDO_OBSTACLES, self.obstacles))
+        for x, y in self.obstacles:
+            self.release(y * self.cols + x)
+        self.obstacles = []
+        self.obstacle_version += 1
+        for _ in range(count):
+            for _ in range(OBSTACLE_ATTEMPTS):
+                if not self.free_inner:
+                    break
+                index = self.free_inner.sample(self.rng)
+
+                if self.difficulty == "Hard" and self.rng.random() < 0.3:
+                    wall_length = self.rng.randint(2, 3)
+                    step = 1 if self.rng.choice(["horizontal", "vertical"]) == "horizontal" else self.cols
+                    x = index % self.cols
+                    y = index // self.cols
+
+                    # The food and occupied cells are already missing from self.free
+                    if step == 1:
+                        valid = x + wall_length <= self.cols
+                    else:
+                        valid = y + wall_length <= self.rows
+                    cells = [index + i * step for i in range(wall_length)]
+                    if valid and all(cell in self.free for cell in cells) and self.place_piece(cells):
+                        break
+                elif self.place_piece([index]):
+                    break
+
+    def add_obstacle(self, index):
+        self.obstacles.append((index % self.cols, index // self.cols))
+        self.occupy(index, OBSTACLE)
+
+    # Places one obstacle piece unless it would cut the head off from the food
+    def place_piece(self, cells):
+        cheap = self.keeps_connected(cells)
+        for cell in cells:
+            self.add_obstacle(cell)
+        if cheap or self.food is None or self.food_reachable():
+            return True
+        for cell in cells:
+            self.obstacles.pop()
+            self.release(cell)
+        return False
+
+    def passable(self, x, y, head):
+        if x < 0 or x >= self.cols or y < 0 or y >= self.rows:
+            return False
+        index = y * self.cols + x
+        return self.grid[index] == EMPTY or index == head
+
+    # Local test for a straight piece, see ring_is_connected
+    def keeps_connected(self, cells):
+        head = self.snake[0][1] * self.cols + self.snake[0][0]
+        return ring_is_connected(cells, self.cols, lambda x, y: self.passable(x, y, head))
+
+    # Flood fill from the head that stops as soon as it reaches the food
+    def food_reachable(self):
+        cols = self.cols
+        start = self.snake[0][1] * cols + self.snake[0][0]
+        target = self.food[1] * cols + self.food[0]
+        grid = self.grid
+        seen = bytearray(len(grid))
+        seen[start] = 1
+        frontier = [start]
+        while frontier:
+            next_frontier = []
+            for index in frontier:
+                x = index % cols
+                for neighbour in (index - cols, index + cols,
+                                  index - 1 if x > 0 else -1,
+                                  index + 1 if x < cols - 1 else -1):
+                    if 0 <= neighbour < len(grid) and not seen[neighbour] and grid[neighbour] == EMPTY:
+                        if neighbour == target:
+                            return True
+                        seen[neighbour] = 1
+                        next_frontier.append(neighbour)
+            frontier = next_frontier
+        return False
+
+    # Non-empty cells inside [left, right) x [top, bottom) as (x, y, value),
+    # the food not included
+    def visible(self, left, top, right, bottom):
+        for x, y in self.obstacles:
+            if left <= x < right and top <= y < bottom:
+                yield x, y, OBSTACLE
+        for x, y in self.snake:
+            if left <= x < right and top <= y < bottom:
+                yield x, y, SNAKE
+
+    def step(self, action=None):
+        if self.game_over:
+            return DIED
+
+        # Ignore turning straight back into the body
+        if action is not None and (action[0] != -self.direction[0] or action[1] != -self.direction[1]):
+            self.direction = action
+
+        self.ticks += 1
+        self.vacated = None
+        x = self.snake[0][0] + self.direction[0]
+        y = self.snake[0][1] + self.direction[1]
+        index = y * self.cols + x
+
+        # Check collisions, the tail hasn't moved yet so it still counts
+        if (x < 0 or x >= self.cols or y < 0 or y >= self.rows or
+            self.grid[index] != EMPTY):
+            self.game_over = True
+            return DIED
+
+        head = (x, y)
+        self.snake.appendleft(head)
+        if self.log is not None:
+            self.log.append((UNDO_HEAD,))
+        self.occupy(index, SNAKE)
+
+        if head == self.food:
+            self.score += 1
+            self.food_count += 1
+            self.food = self.generate_food()
+            if self.food is None:
+                self.game_over = True
+
+            if self.speedrun and self.food_count % 5 == 0:
+                self.speed += 1
+
+            if not self.speedrun:
+                if self.difficulty == "Medium":
+                    self.generate_obstacles(3)
+                elif self.difficulty == "Hard":
+                    self.generate_obstacles(5)
+            return ATE
+
+        self.vacated = self.snake.pop()
+        if self.log is not None:
+            self.log.append((UNDO_TAIL, self.vacated))
+        self.release(self.vacated[1] * self.cols + self.vacated[0])
+        return MOVED
+
+# The game on flat per-cell arrays, which is what lets its state be saved:
+# undo snapshots, clones and a binary form.
+class SnakeEngine(BoardEngine):
+    __slots__ = ()
+
+    # Cheap save point for search: returns a token for restore(). From the
+    # first snapshot on, every change to the board is logged with its inverse,
+    # so restoring costs the moves made since, not the board size. Tokens
+    # nest; a token is only valid until something older is restored.
+    def snapshot(self):
+        if self.log is None:
+            self.log = []
+        return (len(self.log), (self.ticks, self.score, self.food_count, self.speed, self.direction,
+                                self.food, self.vacated, self.game_over, self.obstacle_version))
+
+    def restore(self, token):
+        mark, scalars = token
+        log = self.log
+        while len(log) > mark:
+            entry = log.pop()
+            kind = entry[0]
+            if kind == UNDO_GRID:
+                self.grid[entry[1]] = entry[2]
+            elif kind == UNDO_FREE_REMOVE:
+                entry[1].undo_remove(entry[2], entry[3])
+            elif kind == UNDO_FREE_ADD:
+                entry[1].undo_add(entry[2])
+            elif kind == UNDO_HEAD:
+                self.snake.popleft()
+            elif kind == UNDO_TAIL:
+                self.snake.append(entry[1])
+            elif kind == UNDO_OBSTACLES:
+                self.obstacles = entry[1]
+            else:
+                self.rng.setstate(entry[1])
+        (self.ticks, self.score, self.food_count, self.speed, self.direction,
+         self.food, self.vacated, self.game_over, self.obstacle_version) = scalars
+
+    # Stops logging once the search is done, all tokens become invalid
+    def discard_snapshots(self):
+        self.log = None
+
+    # Independent copy of the game, RNG included, so both play on the same
+    # way. The inner mask is never written and is shared.
+    def clone(self):
+        other = SnakeEngine.__new__(SnakeEngine)
+        other.cols = self.cols
+        other.rows = self.rows
+        other.inner = self.inner
+        other.seed = self.seed
+        other.rng = random.Random()
+        other.rng.setstate(self.rng.getstate())
+        other.grid = bytearray(self.grid)
+        other.free = self.free.copy()
+        other.free_inner = self.free_inner.copy()
+        other.snake = deque(self.snake)
+        other.obstacles = self.obstacles[:]
+        other.log = None
+        for name in ('direction', 'difficulty', 'speed', 'speedrun', 'score', 'food_count', 'ticks',
+                     'game_over', 'vacated', 'obstacle_version', 'food'):
+            setattr(other, name, getattr(self, name))
+        return other
+
+    # Flat binary form for sending a game to another process. The free lists
+    # are stored in their current order and the RNG state is included, so the
+    # copy places the same food as the original. The grid is rebuilt from the
+    # snake and the obstacles.
+    def to_bytes(self):
+        cols = self.cols
+        cell = lambda c: -1 if c is None else c[1] * cols + c[0]
+        flags = int(bool(self.speedrun)) | int(self.game_over) << 1
+        # Version 3 Mersenne Twister state: 624 words and a position. The
+        # engine never calls gauss, so the cached gauss value is always None.
+        rng_state = self.rng.getstate()[1]
+        header = STATE_HEADER.pack(STATE_MAGIC, cols, self.rows, self.seed, self.ticks, self.score,
+                                   self.food_count, self.speed, STATE_DIFFICULTIES.index(self.difficulty),
+                                   STATE_DIRECTIONS.index(self.direction), flags, 0,
+                                   cell(self.food), cell(self.vacated), self.obstacle_version,
+                                   len(self.snake), len(self.obstacles), len(self.free), len(self.free_inner))
+        body = array('I', [cell(c) for c in self.snake])
+        body.extend(cell(c) for c in self.obstacles)
+        body.extend(self.free.cells)
+        body.extend(self.free_inner.cells)
+        body.extend(rng_state)
+        return header + body.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        (magic, cols, rows, seed, ticks, score, food_count, speed, difficulty, direction, flags, _,
+         food, vacated, version, n_snake, n_obstacles, n_free, n_inner) = STATE_HEADER.unpack_from(data)
+        if magic != STATE_MAGIC:
+            raise ValueError("Not a snake game state")
+        body = array('I')
+        body.frombytes(data[STATE_HEADER.size:])
+        cell = lambda i: None if i < 0 else (i % cols, i // cols)
+
+        engine = cls.__new__(cls)
+        engine.cols = cols
+        engine.rows = rows
+        engine.inner = inner_mask(cols, rows)
+        engine.seed = seed
+        engine.log = None
+        engine.ticks = ticks
+        engine.score = score
+        engine.food_count = food_count
+        engine.speed = speed
+        engine.difficulty = STATE_DIFFICULTIES[difficulty]
+        engine.direction = STATE_DIRECTIONS[direction]
+        engine.speedrun = bool(flags & 1)
+        engine.game_over = bool(flags & 2)
+        engine.food = cell(food)
+        engine.vacated = cell(vacated)
+        engine.obstacle_version = version
+
+        size = cols * rows
+        end = n_snake + n_obstacles
+        engine.grid = bytearray(size)
+        engine.snake = deque(cell(i) for i in body[:n_snake])
+        engine.obstacles = [cell(i) for i in body[n_snake:end]]
+        for i in body[:n_snake]:
+            engine.grid[i] = SNAKE
+        for i in body[n_snake:end]:
+            engine.grid[i] = OBSTACLE
+        engine.free = FreeCells(body[end:end + n_free], size)
+        end += n_free
+        engine.free_inner = FreeCells(body[end:end + n_inner], size)
+        end += n_inner
+        engine.rng = random.Random()
+        engine.rng.setstate((3, tuple(body[end:]), None))
+        return engine
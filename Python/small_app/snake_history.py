@@ -0,0 +1,381 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+
+# Problems with the history are reported here, they never stop the game
+log = logging.getLogger(__name__)
+
+# Columns every history entry has, the same fields add_game_to_history records
+FIELDS = ("mode", "start_time", "end_time", "duration", "difficulty", "speed", "score")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    mode TEXT NOT NULL,
+    start_time TEXT NOT NULL,
+    end_time TEXT NOT NULL,
+    duration REAL NOT NULL,
+    difficulty TEXT NOT NULL,
+    speed INTEGER NOT NULL,
+    score INTEGER NOT NULL,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS games_settings ON games (mode, difficulty, speed, start_time);
+CREATE INDEX IF NOT EXISTS games_start ON games (start_time);
+CREATE INDEX IF NOT EXISTS games_leaderboard ON games (mode, difficulty, speed, score DESC);
+
+-- Statistics kept up to date by the games_stats trigger, in the same
+-- transaction as the game, so reading them never scans the games
+CREATE TABLE IF NOT EXISTS brackets (
+    mode TEXT NOT NULL,
+    difficulty TEXT NOT NULL,
+    speed INTEGER NOT NULL,
+    games INTEGER NOT NULL,
+    total_score INTEGER NOT NULL,
+    total_duration REAL NOT NULL,
+    best_score INTEGER NOT NULL,
+    PRIMARY KEY (mode, difficulty, speed)
+);
+CREATE TABLE IF NOT EXISTS days (
+    day TEXT PRIMARY KEY,
+    games INTEGER NOT NULL,
+    total_score INTEGER NOT NULL
+);
+-- Games per whole second of duration, for duration percentiles
+CREATE TABLE IF NOT EXISTS durations (
+    mode TEXT NOT NULL,
+    difficulty TEXT NOT NULL,
+    speed INTEGER NOT NULL,
+    seconds INTEGER NOT NULL,
+    games INTEGER NOT NULL,
+    PRIMARY KEY (mode, difficulty, speed, seconds)
+);
+CREATE TRIGGER IF NOT EXISTS games_stats AFTER INSERT ON games BEGIN
+    INSERT INTO brackets VALUES (NEW.mode, NEW.difficulty, NEW.speed, 1, NEW.score, NEW.duration, NEW.score)
+        ON CONFLICT DO UPDATE SET games = games + 1, total_score = total_score + excluded.total_score,
+            total_duration = total_duration + excluded.total_duration,
+            best_score = MAX(best_score, excluded.best_score);
+    INSERT INTO days VALUES (substr(NEW.start_time, 1, 10), 1, NEW.score)
+        ON CONFLICT DO UPDATE SET games = games + 1, total_score = total_score + excluded.total_score;
+    INSERT INTO durations VALUES (NEW.mode, NEW.difficulty, NEW.speed, CAST(NEW.duration AS INTEGER), 1)
+        ON CONFLICT DO UPDATE SET games = games + 1;
+END;
+"""
+
+# Histories from before the statistics tables get them filled in once
+STATS_VERSION = 1
+BACKFILL_STATS = f"""
+BEGIN;
+DELETE FROM brackets;
+DELETE FROM days;
+DELETE FROM durations;
+INSERT INTO brackets
+    SELECT mode, difficulty, speed, COUNT(*), SUM(score), SUM(duration), MAX(score)
+    FROM games GROUP BY mode, difficulty, speed;
+INSERT INTO days SELECT substr(start_time, 1, 10), COUNT(*), SUM(score) FROM games GROUP BY 1;
+INSERT INTO durations
+    SELECT mode, difficulty, speed, CAST(duration AS INTEGER), COUNT(*)
+    FROM games GROUP BY mode, difficulty, speed, CAST(duration AS INTEGER);
+PRAGMA user_version = {STATS_VERSION};
+COMMIT;
+"""
+
+def _connect(path):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+def _missing_fields(entry):
+    if not isinstance(entry, dict):
+        return list(FIELDS)
+    return [k for k in FIELDS if k not in entry]
+
+def _row_values(entry):
+    # Anything beyond the fixed fields (food_count, replay, ...) goes to extra
+    extra = {k: v for k, v in entry.items() if k not in FIELDS}
+    return tuple(entry[k] for k in FIELDS) + (json.dumps(extra) if extra else None,)
+
+def _load_json(path):
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return []
+
+# Rows of the entries that can be stored, the others are reported and left out
+def _rows(entries):
+    rows = []
+    for entry in entries:
+        try:
+            rows.append(_row_values(entry))
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            log.warning("Skipping history entry %r: %r", entry, e)
+    return rows
+
+INSERT = ("INSERT INTO games (mode, start_time, end_time, duration, difficulty, speed, score, extra) "
+          "VALUES (?, ?, ?, ?, ?, ?, ?, ?)")
+
+def _row_entry(row):
+    entry = dict(zip(FIELDS, row[1:8]))
+    if row[8]:
+        entry.update(json.loads(row[8]))
+    return entry
+
+# Unlimited game history in a local SQLite file. Writes are queued and
+# committed by a background thread so the game loop never waits on disk.
+# The file is created (and import_path, an old JSON history, imported into
+# an empty one) on that thread too, so opening a store returns at once and
+# only the first read waits for it. A damaged file is moved aside and the
+# history starts empty, and reads that fail return nothing.
+class HistoryStore:
+    def __init__(self, path, import_path=None):
+        self.path = path
+        self.conn = None
+        self.ready = threading.Event()
+
+        self.queue = queue.Queue()
+        self.writer = threading.Thread(target=self._write_loop, args=(import_path,),
+                                       name="history-writer", daemon=True)
+        self.writer.start()
+        atexit.register(self.close)
+
+    # The connection used for reads, opened once the writer set up the file.
+    # None if the file can't be opened.
+    def reader(self):
+        if self.conn is None:
+            self.ready.wait()
+            try:
+                self.conn = _connect(self.path)
+            except sqlite3.Error as e:
+                log.warning("Could not read the history in %s: %s", self.path, e)
+        return self.conn
+
+    # Rows of a read, none if the history can't be read
+    def _read(self, sql, params=()):
+        try:
+            conn = self.reader()
+            return conn.execute(sql, params).fetchall() if conn is not None else []
+        except sqlite3.Error as e:
+            log.warning("Could not read the history in %s: %s", self.path, e)
+            return []
+
+    def _open(self):
+        conn = _connect(self.path)
+        try:
+            conn.executescript(SCHEMA)
+            conn.commit()
+            if conn.execute("PRAGMA user_version").fetchone()[0] < STATS_VERSION:
+                conn.executescript(BACKFILL_STATS)
+        except sqlite3.Error:
+            conn.close()
+            raise
+        return conn
+
+    def _setup(self, import_path):
+        try:
+            conn = self._open()
+        except sqlite3.DatabaseError as e:
+            # Can't open is not the file's fault, anything else means it's damaged
+            if isinstance(e, sqlite3.OperationalError):
+                raise
+            broken = self.path + ".corrupt"
+            log.warning("The history in %s is damaged (%s), moved it to %s and started a new one",
+                        self.path, e, broken)
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(self.path + suffix):
+                    os.replace(self.path + suffix, broken + suffix)
+            conn = self._open()
+        if import_path and not conn.execute("SELECT COUNT(*) FROM games").fetchone()[0]:
+            self._insert(conn, _load_json(import_path))
+        return conn
+
+    # Errors are reported and the writer carries on, a dead writer would
+    # leave flush waiting forever
+    def _write_loop(self, import_path):
+        conn = None
+        try:
+            conn = self._setup(import_path)
+        except (sqlite3.Error, OSError) as e:
+            log.warning("Could not open the history in %s: %s", self.path, e)
+        finally:
+            self.ready.set()
+        while True:
+            item = self.queue.get()
+            batch = [item]
+            # Commit everything that piled up in one transaction
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            entries = [item[0] for item in batch if item is not None]
+            try:
+                # Files linked from an entry (replays) are written before the row
+                for item in batch:
+                    if item is not None and item[1]:
+                        for path, data in item[1].items():
+                            self._write_file(path, data)
+                if entries and conn is not None:
+                    self._insert(conn, entries)
+            except Exception as e:
+                log.warning("Could not save %d games to the history: %r", len(entries), e)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+            if len(entries) != len(batch):
+                if conn is not None:
+                    conn.close()
+                return
+
+    # One transaction for all entries. If it fails the entries go in one by
+    # one, so only the rows SQLite rejects are lost.
+    def _insert(self, conn, entries):
+        rows = _rows(entries)
+        try:
+            with conn:
+                conn.executemany(INSERT, rows)
+            return
+        except sqlite3.Error as e:
+            if len(rows) == 1:
+                log.warning("Could not save a game to the history: %s", e)
+                return
+        for row in rows:
+            try:
+                with conn:
+                    conn.execute(INSERT, row)
+            except sqlite3.Error as e:
+                log.warning("Could not save a game to the history: %s", e)
+
+    def _write_file(self, path, data):
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(data)
+        except OSError as e:
+            log.warning("Could not write %s: %s", path, e)
+
+    # files maps paths to bytes that belong to the entry, e.g. its replay
+    def add(self, entry, files=None):
+        missing = _missing_fields(entry)
+        if missing:
+            raise ValueError(f"History entry is missing {', '.join(missing)}")
+        self.queue.put((dict(entry), files))
+
+    # Blocks until every queued entry is on disk
+    def flush(self):
+        self.queue.join()
+
+    def close(self):
+        if self.writer.is_alive():
+            self.queue.put(None)
+            self.writer.join()
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        atexit.unregister(self.close)
+
+    def _where(self, mode, difficulty, speed, since, until):
+        clauses = []
+        params = []
+        for column, value in (("mode", mode), ("difficulty", difficulty), ("speed", speed)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        # Times are "%Y-%m-%d %H:%M:%S" strings so they compare in date order,
+        # a plain "2025-04-30" works as a bound too
+        if since is not None:
+            clauses.append("start_time >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("start_time < ?")
+            params.append(until)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def count(self, mode=None, difficulty=None, speed=None, since=None, until=None):
+        where, params = self._where(mode, difficulty, speed, since, until)
+        rows = self._read("SELECT COUNT(*) FROM games" + where, params)
+        return rows[0][0] if rows else 0
+
+    # Entries in the order they were played, filtered and paged in SQL
+    def query(self, mode=None, difficulty=None, speed=None, since=None, until=None,
+              offset=0, limit=None, newest_first=False):
+        where, params = self._where(mode, difficulty, speed, since, until)
+        sql = "SELECT * FROM games" + where + (" ORDER BY id DESC" if newest_first else " ORDER BY id")
+        sql += " LIMIT ? OFFSET ?"
+        params += [-1 if limit is None else limit, offset]
+        return [_row_entry(row) for row in self._read(sql, params)]
+
+    # Unfiltered entries by position. Games are never deleted, so ids are
+    # contiguous and a position maps straight to an id range instead of
+    # making SQLite walk OFFSET rows.
+    def page(self, offset, limit):
+        first = self._read("SELECT MIN(id) FROM games")
+        if not first or first[0][0] is None:
+            return []
+        rows = self._read("SELECT * FROM games WHERE id >= ? ORDER BY id LIMIT ?", (first[0][0] + offset, limit))
+        return [_row_entry(row) for row in rows]
+
+    # The last `count` entries, oldest first
+    def recent(self, count):
+        return self.query(limit=count, newest_first=True)[::-1]
+
+    # Aggregates per (mode, difficulty, speed), most played first
+    def brackets(self):
+        rows = self._read(
+            "SELECT mode, difficulty, speed, games, total_score, total_duration, best_score FROM brackets "
+            "ORDER BY games DESC, mode, difficulty, speed")
+        return [{"mode": mode, "difficulty": difficulty, "speed": speed, "games": games,
+                 "average_score": total_score / games, "average_duration": total_duration / games,
+                 "best_score": best_score}
+                for mode, difficulty, speed, games, total_score, total_duration, best_score in rows]
+
+    # Best games of one bracket, highest score first and the earliest first
+    # on a tie, read straight off the games_leaderboard index (which ends in
+    # the id, like every SQLite index)
+    def leaderboard(self, mode, difficulty, speed, limit=10):
+        rows = self._read(
+            "SELECT * FROM games WHERE mode = ? AND difficulty = ? AND speed = ? ORDER BY score DESC, id LIMIT ?",
+            (mode, difficulty, speed, limit))
+        return [_row_entry(row) for row in rows]
+
+    # Duration percentiles of one bracket, to the whole second
+    def duration_percentiles(self, mode, difficulty, speed, percentiles=(50, 90)):
+        rows = self._read(
+            "SELECT seconds, games FROM durations WHERE mode = ? AND difficulty = ? AND speed = ? ORDER BY seconds",
+            (mode, difficulty, speed))
+        total = sum(games for _, games in rows)
+        result = []
+        for p in percentiles:
+            rank = p / 100.0 * total
+            seen = 0
+            for seconds, games in rows:
+                seen += games
+                if seen >= rank:
+                    break
+            result.append(seconds if rows else 0)
+        return result
+
+    # (day, games, average score) for the last `count` days played, newest first
+    def days(self, count=7):
+        rows = self._read("SELECT day, games, total_score FROM days ORDER BY day DESC LIMIT ?", (count,))
+        return [(day, games, total_score / games) for day, games, total_score in rows]
+
+    # One-off import of the old snake_history.json list, see also import_path
+    def import_json(self, path):
+        if not os.path.exists(path) or self.count():
+            return 0
+        entries = [entry for entry in _load_json(path) if not _missing_fields(entry)]
+        for entry in entries:
+            self.add(entry)
+        self.flush()
+        return len(entries)
@@ -0,0 +1,98 @@
+import numpy as np
+import pygame
+from snake_config import Config
+from snake_engine import SNAKE, OBSTACLE
+from snake_board import follow_head, board_key, draw_obstacles, draw_pieces
+
+# Channels of a grid observation, each 1 where the thing is and 0 elsewhere.
+# The snake channel includes the head.
+CHANNELS = ("snake", "head", "food", "obstacle")
+SNAKE_CHANNEL, HEAD_CHANNEL, FOOD_CHANNEL, OBSTACLE_CHANNEL = range(4)
+
+# Preallocated (batch, channels, rows, cols) buffer for the observe_* functions
+def grid_buffer(batch, rows=Config.GRID_ROWS, cols=Config.GRID_COLS, dtype=np.uint8):
+    return np.zeros((batch, len(CHANNELS), rows, cols), dtype=dtype)
+
+# Writes the channels of one SnakeEngine game into out, shaped (channels,
+# rows, cols). The engine grid is read in place through the buffer protocol.
+def observe_engine(engine, out):
+    grid = np.frombuffer(engine.grid, dtype=np.uint8).reshape(engine.rows, engine.cols)
+    np.equal(grid, SNAKE, out=out[SNAKE_CHANNEL], casting='unsafe')
+    np.equal(grid, OBSTACLE, out=out[OBSTACLE_CHANNEL], casting='unsafe')
+    out[HEAD_CHANNEL] = 0
+    head_x, head_y = engine.snake[0]
+    out[HEAD_CHANNEL, head_y, head_x] = 1
+    out[FOOD_CHANNEL] = 0
+    if engine.food:
+        out[FOOD_CHANNEL, engine.food[1], engine.food[0]] = 1
+    return out
+
+def observe_engines(engines, out):
+    for engine, slot in zip(engines, out):
+        observe_engine(engine, slot)
+    return out
+
+# Same channels for every game of a SnakeVecEnv at once, out is shaped
+# (num_envs, channels, rows, cols)
+def observe_vec_env(env, out):
+    n = env.num_envs
+    ids = np.arange(n)
+    grid = env.grid.reshape(n, env.rows, env.cols)
+    np.equal(grid, SNAKE, out=out[:, SNAKE_CHANNEL], casting='unsafe')
+    np.equal(grid, OBSTACLE, out=out[:, OBSTACLE_CHANNEL], casting='unsafe')
+    out[:, HEAD_CHANNEL] = 0
+    out[:, FOOD_CHANNEL] = 0
+    head = env.body[ids, env.head_ptr]
+    out[ids, HEAD_CHANNEL, head // env.cols, head % env.cols] = 1
+    has_food = env.food >= 0
+    food = env.food[has_food]
+    out[ids[has_food], FOOD_CHANNEL, food // env.cols, food % env.cols] = 1
+    return out
+
+# RGB frames of the board as the window shows it, without the HUD and the
+# food marker of big worlds. They are drawn with the game's board drawing on
+# a surface of their own, no window needed, and copied out with surfarray.
+# The frame covers the view (the whole board unless it's a world) at
+# cell_pixels per cell, so (rows * cell_pixels, cols * cell_pixels, 3).
+class FrameRenderer:
+    def __init__(self, cell_pixels=4):
+        self.cell_pixels = cell_pixels
+        self.height = Config.GRID_ROWS * cell_pixels
+        self.width = Config.GRID_COLS * cell_pixels
+        self.surface = pygame.Surface((self.width, self.height), 0, 32)
+        # Background and obstacles, redrawn when the board_key changes
+        self.board = pygame.Surface((self.width, self.height), 0, 32)
+        self.board_key = None
+        self.engine = None
+        self.camera = (0, 0)
+
+    def draw(self, engine):
+        if engine is not self.engine:
+            self.engine = engine
+            self.camera = (0, 0)
+        self.camera = follow_head(engine, self.camera)
+        key = board_key(engine, self.camera)
+        if key != self.board_key:
+            self.board.fill(Config.BG_COLOR)
+            draw_obstacles(self.board, engine, self.camera, self.cell_pixels)
+            self.board_key = key
+        self.surface.blit(self.board, (0, 0))
+        draw_pieces(self.surface, engine, self.camera, self.cell_pixels)
+        return self.surface
+
+    def buffer(self, batch):
+        return np.zeros((batch, self.height, self.width, 3), dtype=np.uint8)
+
+    # Writes one frame into out, shaped (height, width, 3)
+    def render(self, engine, out):
+        surface = self.draw(engine)
+        # surfarray is indexed (x, y), the buffer (y, x)
+        pixels = pygame.surfarray.pixels3d(surface)
+        out[...] = pixels.transpose(1, 0, 2)
+        del pixels  # the surface stays locked while the view exists
+        return out
+
+    def render_batch(self, engines, out):
+        for engine, slot in zip(engines, out):
+            self.render(engine, slot)
+        return out
@@ -0,0 +1,128 @@
+import json
+import time
+import pygame
+from collections import deque
+from snake_config import Config
+from snake_text import get_font
+
+def percentile(sorted_samples, p):
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, int(p / 100.0 * len(sorted_samples)))
+    return sorted_samples[index]
+
+# Opt-in per-frame timing. instrument() swaps methods on one object for timed
+# wrappers, so nothing is measured (or slowed down) unless it's attached.
+class FrameProfiler:
+    BACKGROUND = (0, 0, 0)
+    TEXT_COLOR = (0, 255, 0)
+    REFRESH = 0.5  # seconds between overlay redraws
+
+    def __init__(self, fps=Config.FPS, window=600, trace_events=500000):
+        self.budget = 1.0 / fps
+        self.window = window
+        self.origin = time.perf_counter()
+        # Rolling per-frame totals for the last `window` frames
+        self.frame_times = deque(maxlen=window)
+        self.sections = {}
+        self.current = {}
+        self.frames = 0
+        self.dropped = 0
+        self.frame_start = None
+        self.last_start = None
+        # (name, start, duration) in seconds since origin, oldest dropped first
+        self.trace = deque(maxlen=trace_events)
+        self.visible = False
+        self.overlay = None
+        self.overlay_time = 0.0
+        self.font = None
+
+    def instrument(self, obj, names):
+        for name in names:
+            setattr(obj, name, self.timed(name, getattr(obj, name)))
+
+    def timed(self, name, fn):
+        self.sections.setdefault(name, deque(maxlen=self.window))
+        current = self.current
+        trace = self.trace
+        clock = time.perf_counter
+        origin = self.origin
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = clock() - start
+                current[name] = current.get(name, 0.0) + elapsed
+                trace.append((name, start - origin, elapsed))
+        return wrapper
+
+    def begin_frame(self):
+        now = time.perf_counter()
+        # A frame is dropped when the gap since the last one spans more than
+        # one and a half frame budgets
+        if self.last_start is not None:
+            interval = now - self.last_start
+            if interval > 1.5 * self.budget:
+                self.dropped += int(interval / self.budget + 0.5) - 1
+        self.last_start = now
+        self.frame_start = now
+
+    def end_frame(self):
+        if self.frame_start is None:
+            return
+        end = time.perf_counter()
+        elapsed = end - self.frame_start
+        self.frame_times.append(elapsed)
+        self.trace.append(("frame", self.frame_start - self.origin, elapsed))
+        for name, total in self.current.items():
+            self.sections[name].append(total)
+        self.current.clear()
+        self.frames += 1
+        self.frame_start = None
+
+    # name -> (p50, p95, p99) in seconds, frame first
+    def stats(self):
+        result = {}
+        for name, samples in [("frame", self.frame_times)] + list(self.sections.items()):
+            if samples:
+                ordered = sorted(samples)
+                result[name] = (percentile(ordered, 50), percentile(ordered, 95), percentile(ordered, 99))
+        return result
+
+    def lines(self):
+        lines = [f"{'ms':18}{'p50':>7}{'p95':>7}{'p99':>7}"]
+        for name, (p50, p95, p99) in self.stats().items():
+            lines.append(f"{name:18.18}{p50 * 1000:7.2f}{p95 * 1000:7.2f}{p99 * 1000:7.2f}")
+        lines.append(f"dropped {self.dropped} of {self.frames + self.dropped} frames")
+        return lines
+
+    # Blits the stats table at pos and returns the covered rect. The table is
+    # rendered again at most every REFRESH seconds.
+    def draw(self, surface, pos):
+        now = time.perf_counter()
+        if self.overlay is None or now - self.overlay_time >= self.REFRESH:
+            if self.font is None:
+                # Monospaced so the columns line up
+                self.font = get_font('Courier New', 16)
+            rendered = [self.font.render(line, True, self.TEXT_COLOR) for line in self.lines()]
+            width = max(s.get_width() for s in rendered) + 10
+            height = sum(s.get_height() for s in rendered) + 10
+            self.overlay = pygame.Surface((width, height))
+            self.overlay.fill(self.BACKGROUND)
+            y = 5
+            for line in rendered:
+                self.overlay.blit(line, (5, y))
+                y += line.get_height()
+            self.overlay_time = now
+        return surface.blit(self.overlay, pos)
+
+    # Chrome trace event format, opens in chrome://tracing and Perfetto
+    def trace_json(self):
+        events = [{"name": name, "ph": "X", "ts": start * 1e6, "dur": duration * 1e6, "pid": 0, "tid": 0}
+                  for name, start, duration in self.trace]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def dump_trace(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.trace_json(), f)
@@ -0,0 +1,151 @@
+import argparse
+import struct
+import sys
+import time
+from snake_config import Direction
+from snake_engine import SnakeEngine
+from snake_world import WorldEngine
+
+# File layout: header, then one varint per direction change holding
+# (ticks since the previous change << 2) | direction code
+MAGIC = b'SNKR'
+VERSION = 2
+HEADER = struct.Struct('<4sBQHHBBIII')  # magic, version, seed, cols, rows, difficulty, flags, speed, ticks, score
+FLAG_SPEEDRUN = 1
+FLAG_WORLD = 2
+
+DIRECTIONS = (Direction.UP, Direction.DOWN, Direction.LEFT, Direction.RIGHT)
+DIRECTION_CODES = {d: i for i, d in enumerate(DIRECTIONS)}
+DIFFICULTIES = (None, "Easy", "Medium", "Hard")
+
+def _write_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def _read_varint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+# Seed, settings and the direction passed to SnakeEngine.step at each tick
+# where it changed. Enough to replay a game exactly.
+class Replay:
+    def __init__(self, seed, cols, rows, difficulty=None, speed=1, speedrun=False, world=False):
+        self.seed = seed
+        self.cols = cols
+        self.rows = rows
+        # Played on a WorldEngine
+        self.world = world
+        self.difficulty = difficulty
+        self.speed = speed
+        self.speedrun = speedrun
+        self.changes = []
+        self.last = Direction.RIGHT
+        # Filled in by finish() with the result of the recorded game
+        self.ticks = 0
+        self.score = 0
+
+    @classmethod
+    def for_engine(cls, engine):
+        return cls(engine.seed, engine.cols, engine.rows, engine.difficulty,
+                   engine.speed, engine.speedrun, isinstance(engine, WorldEngine))
+
+    # Called before every step, only keeps changes so it costs one compare
+    def record(self, tick, direction):
+        if direction != self.last:
+            self.changes.append((tick, direction))
+            self.last = direction
+
+    def finish(self, engine):
+        self.ticks = engine.ticks
+        self.score = engine.score
+
+    def new_engine(self):
+        engine = (WorldEngine if self.world else SnakeEngine)(self.cols, self.rows)
+        engine.reset(self.difficulty, self.speed, self.speedrun, self.seed)
+        return engine
+
+    # tick -> direction for playback
+    def actions(self):
+        return dict(self.changes)
+
+    def to_bytes(self):
+        out = bytearray(HEADER.pack(MAGIC, VERSION, self.seed, self.cols, self.rows,
+                                    DIFFICULTIES.index(self.difficulty),
+                                    (FLAG_SPEEDRUN if self.speedrun else 0) | (FLAG_WORLD if self.world else 0),
+                                    self.speed, self.ticks, self.score))
+        previous = 0
+        for tick, direction in self.changes:
+            _write_varint(out, (tick - previous) << 2 | DIRECTION_CODES[direction])
+            previous = tick
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, version, seed, cols, rows, difficulty, flags, speed, ticks, score = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a snake replay file")
+        replay = cls(seed, cols, rows, DIFFICULTIES[difficulty], speed, bool(flags & FLAG_SPEEDRUN),
+                     bool(flags & FLAG_WORLD))
+        replay.ticks = ticks
+        replay.score = score
+        pos = HEADER.size
+        tick = 0
+        while pos < len(data):
+            value, pos = _read_varint(data, pos)
+            tick += value >> 2
+            replay.changes.append((tick, DIRECTIONS[value & 3]))
+        if replay.changes:
+            replay.last = replay.changes[-1][1]
+        return replay
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return cls.from_bytes(f.read())
+
+# Runs the whole game without a window as fast as possible
+def play_headless(replay):
+    engine = replay.new_engine()
+    actions = replay.actions()
+    direction = Direction.RIGHT
+    while not engine.game_over and engine.ticks < replay.ticks:
+        direction = actions.get(engine.ticks, direction)
+        engine.step(direction)
+    return engine
+
+def verify(replay):
+    engine = play_headless(replay)
+    return engine.ticks == replay.ticks and engine.score == replay.score
+
+def main():
+    parser = argparse.ArgumentParser(description="Check snake replays by running them headless")
+    parser.add_argument("files", nargs="+")
+    args = parser.parse_args()
+
+    failed = 0
+    for path in args.files:
+        replay = Replay.load(path)
+        start = time.perf_counter()
+        engine = play_headless(replay)
+        elapsed = time.perf_counter() - start
+        ok = engine.ticks == replay.ticks and engine.score == replay.score
+        failed += not ok
+        print(f"{'OK' if ok else 'MISMATCH'} {path}: score {engine.score}/{replay.score}, "
+              f"ticks {engine.ticks}/{replay.ticks}, {engine.ticks / max(elapsed, 1e-9):.0f} ticks/s")
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
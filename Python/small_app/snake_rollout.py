@@ -0,0 +1,189 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import signal
+import time
+from snake_config import Direction
+from snake_engine import SnakeEngine, EMPTY
+from snake_autopilot import autopilot_policy
+
+DIRECTIONS = (Direction.UP, Direction.DOWN, Direction.LEFT, Direction.RIGHT)
+
+# Moves that don't hit a wall, an obstacle or the body on the next tick
+def safe_moves(engine):
+    head_x, head_y = engine.snake[0]
+    moves = []
+    for d in DIRECTIONS:
+        if d[0] == -engine.direction[0] and d[1] == -engine.direction[1]:
+            continue
+        x = head_x + d[0]
+        y = head_y + d[1]
+        if 0 <= x < engine.cols and 0 <= y < engine.rows and engine.grid[y * engine.cols + x] == EMPTY:
+            moves.append(d)
+    return moves
+
+# Random moves from an RNG of its own, seeded per episode like the engine's,
+# so playing never touches the random module's global state
+class RandomPolicy:
+    def __init__(self, seed=None):
+        self.rng = random.Random(seed)
+
+    def __call__(self, engine):
+        return self.rng.choice(DIRECTIONS)
+
+# Head for the food along the shortest Manhattan route, avoiding instant death
+def greedy_policy(engine):
+    moves = safe_moves(engine)
+    if not moves:
+        return None
+    if engine.food is None:
+        return moves[0]
+    head_x, head_y = engine.snake[0]
+    food_x, food_y = engine.food
+    return min(moves, key=lambda d: abs(head_x + d[0] - food_x) + abs(head_y + d[1] - food_y))
+
+# Policies are looked up by name so workers don't need to pickle functions.
+# Each entry makes the policy for one episode from the episode's seed.
+POLICIES = {
+    "random": RandomPolicy,
+    "greedy": lambda seed: greedy_policy,
+    "autopilot": lambda seed: autopilot_policy,
+}
+
+# Same fields as SnakeGame.add_game_to_history, plus food_count and the seed.
+# Duration is game time: one tick lasts 1 / speed seconds.
+def play_episode(policy, seed, difficulty="Easy", speed=5, speedrun=False, max_ticks=100000):
+    engine = SnakeEngine()
+    engine.reset(None if speedrun else difficulty, speed, speedrun, seed)
+    start_time = time.time()
+    duration = 0.0
+    while not engine.game_over and engine.ticks < max_ticks:
+        duration += 1.0 / engine.speed
+        engine.step(policy(engine))
+    end_time = time.time()
+    return {
+        "mode": "Speedrun" if speedrun else "Classic",
+        "start_time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(start_time)),
+        "end_time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(end_time)),
+        "duration": round(duration, 2),
+        "difficulty": difficulty if not speedrun else "N/A",
+        "speed": engine.speed,
+        "score": engine.score,
+        "food_count": engine.food_count,
+        "seed": seed,
+        "ticks": engine.ticks,
+    }
+
+def _init_worker():
+    # Ctrl+C is handled by the parent, which terminates the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def _run_chunk(task):
+    policy_name, seeds, difficulty, speed, speedrun, max_ticks = task
+    make_policy = POLICIES[policy_name]
+    return [play_episode(make_policy(seed), seed, difficulty, speed, speedrun, max_ticks) for seed in seeds]
+
+# Spreads headless episodes over a process pool and streams the results back
+class RolloutFarm:
+    def __init__(self, workers=None, chunk_size=64):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.pool = None
+        self.cancelled = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+
+    # Episode i always gets seed base_seed + i, whatever the worker count
+    def tasks(self, episodes, policy, difficulty, speed, speedrun, base_seed, max_ticks):
+        for start in range(0, episodes, self.chunk_size):
+            seeds = list(range(base_seed + start, base_seed + min(start + self.chunk_size, episodes)))
+            yield (policy, seeds, difficulty, speed, speedrun, max_ticks)
+
+    # Yields one record per episode as chunks finish, in completion order
+    def run(self, episodes, policy="greedy", difficulty="Easy", speed=5, speedrun=False,
+            base_seed=0, max_ticks=100000):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown policy: {policy}")
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.workers, initializer=_init_worker)
+        self.cancelled = False
+        tasks = self.tasks(episodes, policy, difficulty, speed, speedrun, base_seed, max_ticks)
+        try:
+            for chunk in self.pool.imap_unordered(_run_chunk, tasks):
+                for record in chunk:
+                    yield record
+                if self.cancelled:
+                    break
+        except BaseException:
+            self.terminate()
+            raise
+        if self.cancelled:
+            # Drop whatever the workers are still busy with
+            self.terminate()
+
+    def cancel(self):
+        self.cancelled = True
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def terminate(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+def main():
+    parser = argparse.ArgumentParser(description="Run headless snake episodes on all cores")
+    parser.add_argument("--episodes", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=64)
+    parser.add_argument("--policy", choices=sorted(POLICIES), default="greedy")
+    parser.add_argument("--difficulty", choices=["Easy", "Medium", "Hard"], default="Easy")
+    parser.add_argument("--speed", type=int, default=5)
+    parser.add_argument("--speedrun", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-ticks", type=int, default=100000)
+    parser.add_argument("--out", help="write one JSON record per line to this file")
+    args = parser.parse_args()
+
+    out = open(args.out, "w") if args.out else None
+    count = 0
+    ticks = 0
+    total_score = 0
+    start = time.perf_counter()
+    try:
+        with RolloutFarm(args.workers, args.chunk_size) as farm:
+            for record in farm.run(args.episodes, args.policy, args.difficulty, args.speed,
+                                   args.speedrun, args.seed, args.max_ticks):
+                count += 1
+                ticks += record["ticks"]
+                total_score += record["score"]
+                if out:
+                    out.write(json.dumps(record) + "\n")
+    except KeyboardInterrupt:
+        print("Cancelled")
+    finally:
+        if out:
+            out.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"{count} episodes in {elapsed:.2f}s on {args.workers or os.cpu_count()} workers")
+    if count:
+        print(f"{count / elapsed:.1f} episodes/s, {ticks / elapsed:.0f} ticks/s, "
+              f"mean score {total_score / count:.2f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,439 @@
+import argparse
+import asyncio
+import json
+import queue
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from snake_config import Config, Direction
+from snake_engine import SnakeEngine, EMPTY, SNAKE, OBSTACLE
+from snake_replay import DIRECTIONS, DIRECTION_CODES, DIFFICULTIES
+
+# Every message is a u16 length and a body starting with a type byte.
+# Cells are u16 indexes (y * cols + x), which fits boards up to 65535 cells.
+LENGTH = struct.Struct('<H')
+JOIN = struct.Struct('<cIBHB')      # b'J', room, difficulty, speed, flags
+TURN = struct.Struct('<cB')         # b'T', direction code
+RESTART = b'R'
+SNAPSHOT = struct.Struct('<cIHHIHIBBH')  # b'S', tick, cols, rows, score, speed, food_count, difficulty, flags, food
+DELTA = struct.Struct('<cIB')       # b'D', tick, flags, then the fields the flags name
+CELL = struct.Struct('<H')
+SCORE = struct.Struct('<IHI')       # score, speed, food_count
+NO_CELL = 0xFFFF
+
+FLAG_SPEEDRUN = 1
+# Snapshot flags
+FLAG_OVER = 1
+FLAG_ROOM_SPEEDRUN = 2
+# Delta flags. The fields follow in the order head, tail, food, score.
+DELTA_TAIL = 1
+DELTA_FOOD = 2
+DELTA_SCORE = 4
+DELTA_OVER = 8
+DELTA_HEAD = 16
+
+# Clients that fall this far behind are dropped instead of buffered forever
+MAX_BUFFER = 1 << 20
+
+def frame(body):
+    return LENGTH.pack(len(body)) + body
+
+def cell_index(engine, cell):
+    return NO_CELL if cell is None else cell[1] * engine.cols + cell[0]
+
+def encode_snapshot(engine):
+    body = bytearray(SNAPSHOT.pack(b'S', engine.ticks, engine.cols, engine.rows, engine.score, engine.speed,
+                                   engine.food_count, DIFFICULTIES.index(engine.difficulty),
+                                   (FLAG_OVER if engine.game_over else 0) | (FLAG_ROOM_SPEEDRUN if engine.speedrun else 0),
+                                   cell_index(engine, engine.food)))
+    for cells in (engine.snake, engine.obstacles):
+        body += CELL.pack(len(cells))
+        for cell in cells:
+            body += CELL.pack(cell_index(engine, cell))
+    return frame(bytes(body))
+
+# What changed in the last step: new head, the tail cell it left, new food
+# and new score. Obstacle changes are sent as a snapshot instead. The head
+# is sent whenever it moved, also on the step that ends the game by filling
+# the board; a crash leaves it where it was.
+def encode_delta(engine, food, score, head):
+    flags = 0
+    fields = b''
+    if engine.game_over:
+        flags |= DELTA_OVER
+    if engine.snake[0] != head:
+        flags |= DELTA_HEAD
+        fields += CELL.pack(cell_index(engine, engine.snake[0]))
+    if engine.vacated:
+        flags |= DELTA_TAIL
+        fields += CELL.pack(cell_index(engine, engine.vacated))
+    if engine.food != food:
+        flags |= DELTA_FOOD
+        fields += CELL.pack(cell_index(engine, engine.food))
+    if engine.score != score:
+        flags |= DELTA_SCORE
+        fields += SCORE.pack(engine.score, engine.speed, engine.food_count)
+    return frame(DELTA.pack(b'D', engine.ticks, flags) + fields)
+
+# Client side copy of a room's engine, rebuilt from snapshots and deltas.
+# It has everything SnakeGame draws from, but never steps by itself.
+class RemoteEngine(SnakeEngine):
+    def apply(self, body):
+        if body[:1] == b'S':
+            self.apply_snapshot(body)
+        else:
+            self.apply_delta(body)
+
+    def cell(self, index):
+        return None if index == NO_CELL else (index % self.cols, index // self.cols)
+
+    def apply_snapshot(self, body):
+        (_, self.ticks, cols, rows, self.score, self.speed, self.food_count,
+         difficulty, flags, food) = SNAPSHOT.unpack_from(body)
+        self.cols = cols
+        self.rows = rows
+        # The room's own settings, which win over the ones asked for on joining
+        self.difficulty = DIFFICULTIES[difficulty]
+        self.speedrun = bool(flags & FLAG_ROOM_SPEEDRUN)
+        self.game_over = bool(flags & FLAG_OVER)
+        self.food = self.cell(food)
+        self.grid = bytearray(cols * rows)
+        pos = SNAPSHOT.size
+        lists = []
+        for value in (SNAKE, OBSTACLE):
+            (count,) = CELL.unpack_from(body, pos)
+            pos += CELL.size
+            cells = [self.cell(i) for i in struct.unpack_from(f'<{count}H', body, pos)]
+            pos += count * CELL.size
+            for x, y in cells:
+                self.grid[y * cols + x] = value
+            lists.append(cells)
+        self.snake = deque(lists[0])
+        self.obstacles = lists[1]
+        self.direction = self.heading()
+        self.vacated = None
+        # Makes the renderer draw everything again
+        self.obstacle_version += 1
+
+    def apply_delta(self, body):
+        _, self.ticks, flags = DELTA.unpack_from(body)
+        pos = DELTA.size
+        self.vacated = None
+        if flags & DELTA_OVER:
+            self.game_over = True
+        if flags & DELTA_HEAD:
+            (head,) = CELL.unpack_from(body, pos)
+            pos += CELL.size
+            self.snake.appendleft(self.cell(head))
+            self.grid[head] = SNAKE
+        if flags & DELTA_TAIL:
+            (tail,) = CELL.unpack_from(body, pos)
+            pos += CELL.size
+            self.vacated = self.snake.pop()
+            self.grid[tail] = EMPTY
+        if flags & DELTA_HEAD:
+            self.direction = self.heading()
+        if flags & DELTA_FOOD:
+            (food,) = CELL.unpack_from(body, pos)
+            pos += CELL.size
+            self.food = self.cell(food)
+        if flags & DELTA_SCORE:
+            self.score, self.speed, self.food_count = SCORE.unpack_from(body, pos)
+
+    def heading(self):
+        if len(self.snake) < 2:
+            return Direction.RIGHT
+        return (self.snake[0][0] - self.snake[1][0], self.snake[0][1] - self.snake[1][1])
+
+# One game on the server. The first client to join steers, later ones watch.
+class Room:
+    def __init__(self, server, room_id, difficulty, speed, speedrun):
+        self.server = server
+        self.room_id = room_id
+        self.settings = (difficulty, speed, speedrun)
+        self.engine = SnakeEngine()
+        self.clients = []
+        self.turns = deque()
+        self.wake = asyncio.Event()
+        self.restart()
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    def restart(self):
+        difficulty, speed, speedrun = self.settings
+        self.engine.reset(None if speedrun else difficulty, speed, speedrun)
+        self.direction = Direction.RIGHT
+        self.turns.clear()
+        self.wake.set()
+
+    # Same rules as SnakeGame.queue_direction
+    def turn(self, direction):
+        last = self.turns[-1] if self.turns else self.direction
+        if direction == last or (direction[0] == -last[0] and direction[1] == -last[1]):
+            return
+        if len(self.turns) < Config.INPUT_QUEUE_SIZE:
+            self.turns.append(direction)
+
+    def tick(self):
+        engine = self.engine
+        if self.turns:
+            self.direction = self.turns.popleft()
+        food = engine.food
+        head = engine.snake[0]
+        version = engine.obstacle_version
+        score = engine.score
+        engine.step(self.direction)
+        if engine.obstacle_version != version:
+            return encode_snapshot(engine)
+        return encode_delta(engine, food, score, head)
+
+    def broadcast(self, data):
+        for writer in list(self.clients):
+            if writer.transport.get_write_buffer_size() > MAX_BUFFER:
+                self.server.drop(writer)
+                continue
+            writer.write(data)
+            self.server.bytes_sent += len(data)
+            self.server.frames_sent += 1
+
+    # Fixed-rate ticks on the event loop clock. A tick that starts more than
+    # half an interval late counts as late, a whole interval resets the
+    # schedule rather than bursting to catch up.
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while True:
+            if self.engine.game_over:
+                self.wake.clear()
+                await self.wake.wait()
+                next_tick = loop.time()
+            interval = 1.0 / self.engine.speed
+            next_tick += interval
+            delay = next_tick - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif -delay > interval / 2:
+                self.server.late_ticks += 1
+                if -delay > interval:
+                    next_tick = loop.time()
+            self.broadcast(self.tick())
+            self.server.ticks += 1
+
+class SnakeServer:
+    def __init__(self):
+        self.rooms = {}
+        self.writers = {}
+        self.peak_rooms = 0
+        self.ticks = 0
+        self.late_ticks = 0
+        self.frames_sent = 0
+        self.bytes_sent = 0
+
+    def join(self, writer, room_id, difficulty, speed, speedrun):
+        room = self.rooms.get(room_id)
+        if room is None:
+            room = self.rooms[room_id] = Room(self, room_id, difficulty, speed, speedrun)
+            self.peak_rooms = max(self.peak_rooms, len(self.rooms))
+        room.clients.append(writer)
+        self.writers[writer] = room
+        writer.write(encode_snapshot(room.engine))
+        return room
+
+    def drop(self, writer):
+        room = self.writers.pop(writer, None)
+        if room is not None:
+            room.clients.remove(writer)
+            if not room.clients:
+                room.task.cancel()
+                del self.rooms[room.room_id]
+        writer.close()
+
+    async def handle(self, reader, writer):
+        writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            while True:
+                (size,) = LENGTH.unpack(await reader.readexactly(LENGTH.size))
+                body = await reader.readexactly(size)
+                room = self.writers.get(writer)
+                if body[:1] == b'J' and room is None:
+                    _, room_id, difficulty, speed, flags = JOIN.unpack(body)
+                    if difficulty >= len(DIFFICULTIES):
+                        break
+                    self.join(writer, room_id, DIFFICULTIES[difficulty], max(1, speed), bool(flags & FLAG_SPEEDRUN))
+                elif room is None or writer is not room.clients[0]:
+                    continue
+                elif body[:1] == b'T':
+                    _, code = TURN.unpack(body)
+                    room.turn(DIRECTIONS[code & 3])
+                elif body[:1] == RESTART and room.engine.game_over:
+                    room.restart()
+                    room.broadcast(encode_snapshot(room.engine))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        # A malformed frame drops the client, the server carries on
+        except (struct.error, IndexError, KeyError):
+            pass
+        finally:
+            self.drop(writer)
+
+    def stats(self):
+        return {"rooms": len(self.rooms), "peak_rooms": self.peak_rooms, "ticks": self.ticks,
+                "late_ticks": self.late_ticks, "frames_sent": self.frames_sent, "bytes_sent": self.bytes_sent}
+
+async def serve(host, port, duration=None):
+    server = SnakeServer()
+    listener = await asyncio.start_server(server.handle, host, port)
+    print(f"listening on {host}:{listener.sockets[0].getsockname()[1]}", flush=True)
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    try:
+        async with listener:
+            if duration is None:
+                await listener.serve_forever()
+            else:
+                await asyncio.sleep(duration)
+    finally:
+        stats = server.stats()
+        stats["wall_seconds"] = time.perf_counter() - wall
+        stats["cpu_seconds"] = time.process_time() - cpu
+        print(json.dumps(stats), flush=True)
+
+# Blocking client for the pygame thin client. A thread reads frames into a
+# queue, the game loop applies them to `engine` so only it touches the engine.
+class RemoteClient:
+    def __init__(self, host, port, room_id, difficulty="Easy", speed=10, speedrun=False):
+        self.sock = socket.create_connection((host, port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.engine = RemoteEngine()
+        self.difficulty = difficulty
+        self.speedrun = speedrun
+        self.frames = queue.Queue()
+        self.connected = True
+        self.send(JOIN.pack(b'J', room_id, DIFFICULTIES.index(difficulty), speed,
+                            FLAG_SPEEDRUN if speedrun else 0))
+        self.reader = threading.Thread(target=self._read, name="snake-client", daemon=True)
+        self.reader.start()
+
+    def _read(self):
+        stream = self.sock.makefile('rb')
+        try:
+            while True:
+                header = stream.read(LENGTH.size)
+                if len(header) < LENGTH.size:
+                    break
+                (size,) = LENGTH.unpack(header)
+                self.frames.put(stream.read(size))
+        except OSError:
+            pass
+        self.frames.put(None)
+
+    def send(self, body):
+        try:
+            self.sock.sendall(frame(body))
+        except OSError:
+            self.connected = False
+
+    def turn(self, direction):
+        self.send(TURN.pack(b'T', DIRECTION_CODES[direction]))
+
+    def restart(self):
+        self.send(RESTART)
+
+    # Frames received since the last call, None marks a lost connection
+    def poll(self):
+        frames = []
+        while True:
+            try:
+                frames.append(self.frames.get_nowait())
+            except queue.Empty:
+                return frames
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+# Loopback load test client: mirrors its room and steers greedily
+async def simulated_client(host, port, room_id, difficulty, speed, speedrun, until, results):
+    from snake_rollout import greedy_policy
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(frame(JOIN.pack(b'J', room_id, DIFFICULTIES.index(difficulty), speed,
+                                 FLAG_SPEEDRUN if speedrun else 0)))
+    engine = RemoteEngine()
+    loop = asyncio.get_running_loop()
+    try:
+        while loop.time() < until:
+            (size,) = LENGTH.unpack(await reader.readexactly(LENGTH.size))
+            body = await reader.readexactly(size)
+            engine.apply(body)
+            results["frames"] += 1
+            results["bytes"] += size + LENGTH.size
+            if engine.game_over:
+                results["games"] += 1
+                writer.write(frame(RESTART))
+                continue
+            move = greedy_policy(engine)
+            if move and move != engine.direction:
+                writer.write(frame(TURN.pack(b'T', DIRECTION_CODES[move])))
+    except (asyncio.IncompleteReadError, ConnectionError):
+        results["errors"] += 1
+    finally:
+        writer.close()
+
+async def run_clients(host, port, rooms, difficulty, speed, speedrun, seconds):
+    results = {"frames": 0, "bytes": 0, "games": 0, "errors": 0}
+    until = asyncio.get_running_loop().time() + seconds
+    await asyncio.gather(*(simulated_client(host, port, room_id, difficulty, speed, speedrun, until, results)
+                           for room_id in range(rooms)))
+    return results
+
+# Starts a server process, plays `rooms` rooms against it over loopback and
+# estimates rooms per core from the server's own CPU time
+def bench(args):
+    server = subprocess.Popen([sys.executable, __file__, "serve", "--port", "0",
+                               "--duration", str(args.seconds + 2)],
+                              stdout=subprocess.PIPE, text=True)
+    port = int(server.stdout.readline().rsplit(":", 1)[1])
+    results = asyncio.run(run_clients("127.0.0.1", port, args.rooms, args.difficulty, args.speed,
+                                      args.speedrun, args.seconds))
+    stats = json.loads(server.stdout.readline())
+    server.wait()
+
+    load = stats["cpu_seconds"] / stats["wall_seconds"]
+    late = stats["late_ticks"] / max(1, stats["ticks"])
+    print(f"{args.rooms} rooms at {args.speed} ticks/s for {args.seconds}s: {stats['ticks']} ticks, "
+          f"{late:.2%} late, server at {load:.0%} of one core")
+    print(f"clients got {results['frames']} frames, {results['bytes'] / max(1, results['frames']):.1f} bytes/frame "
+          f"on average, {results['games']} games over, {results['errors']} errors")
+    if load > 0:
+        print(f"about {args.rooms / load:.0f} rooms per core at {args.speed} ticks/s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Snake game server hosting many rooms")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve_parser = sub.add_parser("serve", help="run the server")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    serve_parser.add_argument("--duration", type=float, help="stop after this many seconds and print stats")
+    bench_parser = sub.add_parser("bench", help="load test over loopback with simulated clients")
+    bench_parser.add_argument("--rooms", type=int, default=200)
+    bench_parser.add_argument("--speed", type=int, default=10)
+    bench_parser.add_argument("--difficulty", choices=["Easy", "Medium", "Hard"], default="Easy")
+    bench_parser.add_argument("--speedrun", action="store_true")
+    bench_parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        try:
+            asyncio.run(serve(args.host, args.port, args.duration))
+        except KeyboardInterrupt:
+            pass
+    else:
+        bench(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+import pygame
+from collections import OrderedDict
+
+# Fonts shared by the whole process, by (name, size). SysFont searches the
+# system fonts and loads the file on every call, this does it once per font.
+_fonts = {}
+
+def get_font(name, size):
+    font = _fonts.get((name, size))
+    if font is None:
+        if not pygame.font.get_init():
+            pygame.font.init()
+        font = _fonts[(name, size)] = pygame.font.SysFont(name, size)
+    return font
+
+# Bounded LRU cache of rendered text surfaces, keyed by font, string and color
+class TextCache:
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def render(self, font, text, color):
+        key = (font, text, color)
+        surface = self.entries.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return surface
+
+        self.misses += 1
+        surface = font.render(text, True, color)
+        self.entries[key] = surface
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return surface
+
+    # Blits a fixed label followed by a value that changes every frame, like
+    # "Time: " + "12.3s". The value is built from cached glyphs so a new
+    # timer reading doesn't render a new surface. Returns the covered rect.
+    def blit_composed(self, target, font, label, value, color, pos):
+        label_surface = self.render(font, label, color)
+        rect = target.blit(label_surface, pos)
+        x = rect.right
+        for char in value:
+            glyph = self.render(font, char, color)
+            rect.union_ip(target.blit(glyph, (x, pos[1])))
+            x += glyph.get_width()
+        return rect
+
+    def clear(self):
+        self.entries.clear()
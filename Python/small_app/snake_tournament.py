@@ -0,0 +1,193 @@
+import argparse
+import json
+import math
+import os
+import time
+from snake_rollout import RolloutFarm, POLICIES
+
+# What is tracked per policy and bracket, all fields of an episode record
+METRICS = ("score", "duration", "food_count")
+QUANTILES = (0.5, 0.9, 0.99)
+DIFFICULTIES = ("Easy", "Medium", "Hard")
+
+# Welford's streaming mean and variance
+class RunningStats:
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def std(self):
+        return math.sqrt(self.variance())
+
+# Jain and Chlamtac's P-square estimate of the p quantile: five markers
+# whose heights are nudged towards the quantile as values stream in, so
+# memory stays the same however many values there are
+class P2Quantile:
+    def __init__(self, p):
+        self.p = p
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, x):
+        q = self.heights
+        if len(q) < 5:
+            q.append(x)
+            q.sort()
+            return
+
+        n = self.positions
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        for i in (1, 2, 3):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                height = self.parabolic(i, d)
+                if not q[i - 1] < height < q[i + 1]:
+                    height = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = height
+                n[i] += d
+
+    def parabolic(self, i, d):
+        q = self.heights
+        n = self.positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+            (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+
+    def value(self):
+        q = self.heights
+        if len(q) < 5:
+            # Still exact while there are only a few values
+            return q[min(len(q) - 1, int(self.p * len(q)))] if q else 0.0
+        return q[2]
+
+# Streaming stats of every metric for one policy in one bracket
+class Summary:
+    def __init__(self):
+        self.stats = {name: RunningStats() for name in METRICS}
+        self.quantiles = {name: [P2Quantile(p) for p in QUANTILES] for name in METRICS}
+
+    def add(self, record):
+        for name in METRICS:
+            value = record[name]
+            self.stats[name].add(value)
+            for estimator in self.quantiles[name]:
+                estimator.add(value)
+
+    def to_dict(self):
+        result = {}
+        for name in METRICS:
+            stats = self.stats[name]
+            result[name] = {"count": stats.count, "mean": stats.mean, "std": stats.std(),
+                            "min": stats.min, "max": stats.max}
+            for p, estimator in zip(QUANTILES, self.quantiles[name]):
+                result[name][f"p{int(p * 100)}"] = estimator.value()
+        return result
+
+# (mode, difficulty, speed, speedrun) for every mode the game has. A
+# speedrun always starts at speed 5, like the Speedrun Mode button.
+def brackets(difficulties, speeds, speedrun):
+    result = [("Classic", difficulty, speed, False) for difficulty in difficulties for speed in speeds]
+    if speedrun:
+        result.append(("Speedrun", "N/A", 5, True))
+    return result
+
+def print_table(rows):
+    print(f"{'policy':10} {'mode':8} {'difficulty':10} {'speed':>5} {'games':>6} "
+          f"{'score':>7} {'std':>6} {'p50':>5} {'p90':>5} {'p99':>5} {'time s':>8} {'food':>7}")
+    for policy, mode, difficulty, speed, summary in rows:
+        score = summary["score"]
+        print(f"{policy:10} {mode:8} {difficulty:10} {speed:5} {score['count']:6} "
+              f"{score['mean']:7.2f} {score['std']:6.2f} {score['p50']:5.0f} {score['p90']:5.0f} {score['p99']:5.0f} "
+              f"{summary['duration']['mean']:8.1f} {summary['food_count']['mean']:7.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Play policies against each other on every mode and difficulty")
+    parser.add_argument("--policies", default="greedy,autopilot",
+                        help="comma separated: " + ",".join(sorted(POLICIES)))
+    parser.add_argument("--episodes", type=int, default=1000, help="seeds per policy and bracket")
+    parser.add_argument("--difficulties", default=",".join(DIFFICULTIES))
+    parser.add_argument("--speeds", default="5,10", help="comma separated Classic speeds")
+    parser.add_argument("--no-speedrun", action="store_true", help="skip the Speedrun bracket")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0, help="first seed, every policy plays the same seeds")
+    parser.add_argument("--max-ticks", type=int, default=100000)
+    parser.add_argument("--out", help="write every game as a JSON line, in the history schema plus the policy")
+    parser.add_argument("--summary", help="write the summary table as JSON to this file")
+    args = parser.parse_args()
+
+    policies = args.policies.split(",")
+    for policy in policies:
+        if policy not in POLICIES:
+            parser.error(f"Unknown policy: {policy}")
+    difficulties = args.difficulties.split(",")
+    for difficulty in difficulties:
+        if difficulty not in DIFFICULTIES:
+            parser.error(f"Unknown difficulty: {difficulty}")
+    speeds = [int(speed) for speed in args.speeds.split(",")]
+
+    out = open(args.out, "w") if args.out else None
+    rows = []
+    games = 0
+    start = time.perf_counter()
+    try:
+        # One pool for the whole tournament
+        with RolloutFarm(args.workers, args.chunk_size) as farm:
+            for mode, difficulty, speed, speedrun in brackets(difficulties, speeds, not args.no_speedrun):
+                for policy in policies:
+                    summary = Summary()
+                    for record in farm.run(args.episodes, policy, difficulty, speed, speedrun,
+                                           args.seed, args.max_ticks):
+                        summary.add(record)
+                        games += 1
+                        if out:
+                            record["policy"] = policy
+                            out.write(json.dumps(record) + "\n")
+                    rows.append((policy, mode, difficulty, speed, summary.to_dict()))
+    except KeyboardInterrupt:
+        print("Cancelled")
+    finally:
+        if out:
+            out.close()
+
+    elapsed = time.perf_counter() - start
+    print_table(rows)
+    print(f"{games} games in {elapsed:.1f}s on {args.workers or os.cpu_count()} workers")
+    if args.summary:
+        with open(args.summary, "w") as f:
+            json.dump([{"policy": policy, "mode": mode, "difficulty": difficulty, "speed": speed, **summary}
+                       for policy, mode, difficulty, speed, summary in rows], f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+import numpy as np
+from snake_config import Config, Direction
+from snake_engine import EMPTY, SNAKE, OBSTACLE, OBSTACLE_MARGIN
+
+# Extra observation values on top of the occupancy grid
+FOOD = 3
+HEAD = 4
+
+# Action numbers used by step(), -1 keeps the current direction
+ACTIONS = (Direction.UP, Direction.DOWN, Direction.LEFT, Direction.RIGHT)
+UP, DOWN, LEFT, RIGHT = range(4)
+OPPOSITE = np.array([DOWN, UP, RIGHT, LEFT])
+DX = np.array([d[0] for d in ACTIONS])
+DY = np.array([d[1] for d in ACTIONS])
+
+DIFFICULTIES = ("Easy", "Medium", "Hard")
+START_OBSTACLES = {"Easy": 0, "Medium": 5, "Hard": 10}
+FOOD_OBSTACLES = {"Easy": 0, "Medium": 3, "Hard": 5}
+
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+_MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX2 = np.uint64(0x94D049BB133111EB)
+
+# splitmix64 finalizer, works elementwise on uint64 arrays
+def _mix(x):
+    x = x + _GOLDEN
+    x = (x ^ (x >> np.uint64(30))) * _MIX1
+    x = (x ^ (x >> np.uint64(27))) * _MIX2
+    return x ^ (x >> np.uint64(31))
+
+# N independent games advanced together with array operations
+class SnakeVecEnv:
+    def __init__(self, num_envs, difficulty="Easy", speed=5, speedrun=False,
+                 cols=Config.GRID_COLS, rows=Config.GRID_ROWS):
+        if difficulty not in DIFFICULTIES:
+            raise ValueError(f"Unknown difficulty: {difficulty}")
+        self.num_envs = num_envs
+        self.difficulty = difficulty
+        self.start_speed = speed
+        self.speedrun = speedrun
+        self.cols = cols
+        self.rows = rows
+        self.size = cols * rows
+        self.start_obstacles = 0 if speedrun else START_OBSTACLES[difficulty]
+        self.food_obstacles = 0 if speedrun else FOOD_OBSTACLES[difficulty]
+
+        self.inner = np.zeros((rows, cols), dtype=bool)
+        self.inner[OBSTACLE_MARGIN:rows - OBSTACLE_MARGIN, OBSTACLE_MARGIN:cols - OBSTACLE_MARGIN] = True
+        self.inner = self.inner.ravel()
+
+        n = num_envs
+        self.grid = np.zeros((n, self.size), dtype=np.uint8)
+        # Ring buffer of body cells, body[i, head_ptr[i]] is the head
+        self.body = np.zeros((n, self.size), dtype=np.int32)
+        self.head_ptr = np.zeros(n, dtype=np.int64)
+        self.length = np.zeros(n, dtype=np.int64)
+        self.direction = np.zeros(n, dtype=np.int64)
+        self.food = np.zeros(n, dtype=np.int64)
+        self.score = np.zeros(n, dtype=np.int64)
+        self.food_count = np.zeros(n, dtype=np.int64)
+        self.speed = np.zeros(n, dtype=np.int64)
+        self.ticks = np.zeros(n, dtype=np.int64)
+        # Game seconds played, 1 / speed per tick
+        self.elapsed = np.zeros(n, dtype=np.float64)
+        self.seeds = np.zeros(n, dtype=np.uint64)
+        self.draws = np.zeros(n, dtype=np.uint64)
+
+        # Stats of the last finished episode of each game
+        self.last_score = np.zeros(n, dtype=np.int64)
+        self.last_food_count = np.zeros(n, dtype=np.int64)
+        self.last_speed = np.zeros(n, dtype=np.int64)
+        self.last_ticks = np.zeros(n, dtype=np.int64)
+        self.last_elapsed = np.zeros(n, dtype=np.float64)
+        self.episodes = np.zeros(n, dtype=np.int64)
+
+    def reset(self, seeds=None):
+        if seeds is None:
+            seeds = np.random.SeedSequence().generate_state(self.num_envs, dtype=np.uint64)
+        elif np.isscalar(seeds):
+            seeds = np.arange(self.num_envs, dtype=np.uint64) + np.uint64(seeds)
+        self.seeds[:] = np.asarray(seeds, dtype=np.uint64)
+        self.draws[:] = 0
+        self.episodes[:] = 0
+        self.reset_envs(np.arange(self.num_envs))
+        return self.observe()
+
+    # Uniform floats in [0, 1), a row of `width` per game in env_ids.
+    # Each game has its own counter based stream so results don't depend on
+    # which other games share the batch.
+    def random(self, env_ids, width):
+        key = _mix(self.seeds[env_ids] ^ _mix(self.draws[env_ids]))
+        self.draws[env_ids] += np.uint64(1)
+        cells = np.arange(width, dtype=np.uint64) * _GOLDEN
+        bits = _mix(key[:, None] + cells[None, :])
+        return (bits >> np.uint64(11)).astype(np.float64) * (1.0 / (1 << 53))
+
+    def reset_envs(self, env_ids):
+        if len(env_ids) == 0:
+            return
+        head = (self.rows // 2) * self.cols + self.cols // 2
+        self.grid[env_ids] = EMPTY
+        self.body[env_ids, :3] = [head - 2, head - 1, head]
+        self.grid[env_ids[:, None], self.body[env_ids, :3]] = SNAKE
+        self.head_ptr[env_ids] = 2
+        self.length[env_ids] = 3
+        self.direction[env_ids] = RIGHT
+        self.score[env_ids] = 0
+        self.food_count[env_ids] = 0
+        self.speed[env_ids] = self.start_speed
+        self.ticks[env_ids] = 0
+        self.elapsed[env_ids] = 0.0
+        self.spawn_food(env_ids)
+        if self.start_obstacles:
+            self.place_obstacles(env_ids, self.start_obstacles)
+
+    # Returns a mask of games where the board was full
+    def spawn_food(self, env_ids):
+        free = self.grid[env_ids] == EMPTY
+        scores = np.where(free, self.random(env_ids, self.size), -1.0)
+        self.food[env_ids] = scores.argmax(1)
+        full = ~free.any(1)
+        self.food[env_ids[full]] = -1
+        return full
+
+    # Same layout rules as SnakeEngine.generate_obstacles, retried per piece
+    # for the games whose candidate was rejected. There is no reachability
+    # check here, a boxed-in game just ends and is reset.
+    def place_obstacles(self, env_ids, count):
+        grid = self.grid[env_ids]
+        grid[grid == OBSTACLE] = EMPTY
+        food = self.food[env_ids]
+        has_food = food >= 0
+        hard = self.difficulty == "Hard"
+        offsets = np.arange(3)
+
+        for _ in range(count):
+            pending = np.ones(len(env_ids), dtype=bool)
+            while pending.any():
+                p = np.nonzero(pending)[0]
+                free = (grid[p] == EMPTY) & self.inner
+                free[np.nonzero(has_food[p])[0], food[p[has_food[p]]]] = False
+                some = free.any(1)
+                pending[p[~some]] = False
+                p = p[some]
+                if len(p) == 0:
+                    break
+                free = free[some]
+
+                r = self.random(env_ids[p], self.size + 3)
+                start = np.where(free, r[:, :self.size], -1.0).argmax(1)
+                wall = hard & (r[:, self.size] < 0.3)
+                length = np.where(wall, np.where(r[:, self.size + 1] < 0.5, 2, 3), 1)
+                horizontal = r[:, self.size + 2] < 0.5
+                step = np.where(horizontal, 1, self.cols)
+
+                in_bounds = np.where(horizontal,
+                                     start % self.cols + length <= self.cols,
+                                     start // self.cols + length <= self.rows)
+                used = offsets[None, :] < length[:, None]
+                cells = start[:, None] + offsets[None, :] * step[:, None]
+                cells = np.where(used & in_bounds[:, None], cells, start[:, None])
+                cell_ok = (grid[p[:, None], cells] == EMPTY) & (cells != food[p][:, None])
+                valid = in_bounds & np.all(cell_ok | ~used, axis=1)
+
+                rows = p[valid]
+                cells = cells[valid]
+                used = used[valid]
+                grid[np.repeat(rows, used.sum(1)), cells[used]] = OBSTACLE
+                pending[rows] = False
+
+        self.grid[env_ids] = grid
+
+    def step(self, actions):
+        all_ids = np.arange(self.num_envs)
+        actions = np.asarray(actions)
+        turn = (actions >= 0) & (actions != OPPOSITE[self.direction])
+        self.direction = np.where(turn, actions, self.direction)
+
+        head = self.body[all_ids, self.head_ptr]
+        x = head % self.cols + DX[self.direction]
+        y = head // self.cols + DY[self.direction]
+        inside = (x >= 0) & (x < self.cols) & (y >= 0) & (y < self.rows)
+        new_head = np.where(inside, y * self.cols + x, 0)
+
+        # The tail hasn't moved yet so it still counts, as in move_snake
+        died = ~inside | (self.grid[all_ids, new_head] != EMPTY)
+        alive = ~died
+        ate = alive & (new_head == self.food)
+        moved = alive & ~ate
+
+        tail_ptr = (self.head_ptr - self.length + 1) % self.size
+        tails = self.body[all_ids, tail_ptr]
+        self.grid[all_ids[moved], tails[moved]] = EMPTY
+
+        alive_ids = all_ids[alive]
+        self.head_ptr[alive] = (self.head_ptr[alive] + 1) % self.size
+        self.body[alive_ids, self.head_ptr[alive]] = new_head[alive]
+        self.grid[alive_ids, new_head[alive]] = SNAKE
+        self.length += ate
+
+        self.ticks += 1
+        self.elapsed += 1.0 / self.speed
+        self.score += ate
+        self.food_count += ate
+        if self.speedrun:
+            self.speed += ate & (self.food_count % 5 == 0)
+
+        done = died.copy()
+        ate_ids = all_ids[ate]
+        if len(ate_ids):
+            done[ate_ids[self.spawn_food(ate_ids)]] = True
+            if self.food_obstacles:
+                self.place_obstacles(ate_ids, self.food_obstacles)
+
+        reward = ate.astype(np.float32) - died.astype(np.float32)
+
+        finished = all_ids[done]
+        if len(finished):
+            self.last_score[finished] = self.score[finished]
+            self.last_food_count[finished] = self.food_count[finished]
+            self.last_speed[finished] = self.speed[finished]
+            self.last_ticks[finished] = self.ticks[finished]
+            self.last_elapsed[finished] = self.elapsed[finished]
+            self.episodes[finished] += 1
+            self.reset_envs(finished)
+
+        return self.observe(), reward, done
+
+    # (N, rows, cols) grid with FOOD and HEAD marked
+    def observe(self):
+        all_ids = np.arange(self.num_envs)
+        obs = self.grid.copy()
+        has_food = self.food >= 0
+        obs[all_ids[has_food], self.food[has_food]] = FOOD
+        obs[all_ids, self.body[all_ids, self.head_ptr]] = HEAD
+        return obs.reshape(self.num_envs, self.rows, self.cols)
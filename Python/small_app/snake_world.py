@@ -0,0 +1,170 @@
+import random
+from snake_config import Config
+from snake_engine import (BoardEngine, ring_is_connected, EMPTY, SNAKE, OBSTACLE,
+                          OBSTACLE_MARGIN, OBSTACLE_ATTEMPTS)
+
+# Side of a chunk of the spatial index, in cells
+CHUNK = 32
+# Obstacles per cell on the normal board, which a world keeps the same
+OBSTACLE_AREA = (Config.GRID_COLS - 2 * OBSTACLE_MARGIN) * (Config.GRID_ROWS - 2 * OBSTACLE_MARGIN)
+# Food is placed within this many cells of the head so it can be found
+FOOD_RADIUS = 40
+FOOD_ATTEMPTS = 1000
+# Replay headers store the size as u16
+MAX_WORLD_SIDE = 65535
+
+# Occupancy for boards too big for one byte per cell. Snake cells are kept in
+# per-chunk sets, obstacles are generated per chunk the first time a chunk is
+# looked at. Memory follows the snake and the chunks seen, not the world size.
+class SparseGrid:
+    def __init__(self, engine):
+        self.engine = engine
+        self.cols = engine.cols
+        self.size = engine.cols * engine.rows
+        self.body = {}
+        self.obstacles = {}
+
+    def __len__(self):
+        return self.size
+
+    def chunk_of(self, index):
+        return (index % self.cols // CHUNK, index // self.cols // CHUNK)
+
+    def obstacle_chunk(self, key):
+        cells = self.obstacles.get(key)
+        if cells is None:
+            cells = self.obstacles[key] = self.engine.chunk_obstacles(key)
+        return cells
+
+    def __getitem__(self, index):
+        key = self.chunk_of(index)
+        body = self.body.get(key)
+        if body and index in body:
+            return SNAKE
+        if index in self.obstacle_chunk(key):
+            return OBSTACLE
+        return EMPTY
+
+    # Only the snake is written, obstacles come from chunk_obstacles
+    def __setitem__(self, index, value):
+        key = self.chunk_of(index)
+        if value == SNAKE:
+            self.body.setdefault(key, set()).add(index)
+        else:
+            body = self.body.get(key)
+            if body:
+                body.discard(index)
+                if not body:
+                    del self.body[key]
+
+    # Drops the generated obstacles so chunks are generated again
+    def clear_obstacles(self):
+        self.obstacles = {}
+
+# BoardEngine for worlds far bigger than the window, e.g. 5000x5000. Same
+# rules, but nothing is stored per cell: the grid is a SparseGrid, food is
+# found by rejection sampling near the head and obstacles are a pure function
+# of the seed, the obstacle version and the chunk, so replays stay exact no
+# matter which chunks the renderer happened to look at first.
+class WorldEngine(BoardEngine):
+    def __init__(self, cols, rows):
+        self.cols = cols
+        self.rows = rows
+        self.reset()
+
+    def new_board(self):
+        self.grid = SparseGrid(self)
+        # Obstacle pieces per chunk and the cells they must keep clear
+        self.density = 0.0
+        self.reserved = set()
+
+    def occupy(self, index, value):
+        self.grid[index] = value
+
+    def release(self, index):
+        self.grid[index] = EMPTY
+
+    def generate_food(self):
+        head_x, head_y = self.snake[0]
+        left = max(0, head_x - FOOD_RADIUS)
+        right = min(self.cols - 1, head_x + FOOD_RADIUS)
+        top = max(0, head_y - FOOD_RADIUS)
+        bottom = min(self.rows - 1, head_y + FOOD_RADIUS)
+        for _ in range(FOOD_ATTEMPTS):
+            x = self.rng.randint(left, right)
+            y = self.rng.randint(top, bottom)
+            if self.grid[y * self.cols + x] == EMPTY:
+                return (x, y)
+        return None
+
+    # Chunks are filled in lazily, this only starts a new layout
+    def generate_obstacles(self, count):
+        self.obstacle_version += 1
+        self.density = count * (CHUNK - 2) * (CHUNK - 2) / OBSTACLE_AREA
+        self.reserved = {y * self.cols + x for x, y in self.snake}
+        if self.food is not None:
+            self.reserved.add(self.food[1] * self.cols + self.food[0])
+        self.grid.clear_obstacles()
+
+    # Pieces keep off the chunk border, so the ring around a piece lies in its
+    # own chunk and never touches another chunk's obstacles: the ring test can
+    # run on this chunk alone. It ignores the snake to stay independent of
+    # when the chunk is generated.
+    def chunk_obstacles(self, key):
+        cells = set()
+        if not self.density:
+            return cells
+        cx, cy = key
+        rng = random.Random(f"{self.seed}:{self.obstacle_version}:{cx}:{cy}")
+        count = int(self.density) + (rng.random() < self.density - int(self.density))
+
+        left = max(cx * CHUNK + 1, OBSTACLE_MARGIN)
+        top = max(cy * CHUNK + 1, OBSTACLE_MARGIN)
+        right = min(cx * CHUNK + CHUNK - 1, self.cols - OBSTACLE_MARGIN)
+        bottom = min(cy * CHUNK + CHUNK - 1, self.rows - OBSTACLE_MARGIN)
+        if left >= right or top >= bottom:
+            return cells
+
+        def passable(x, y):
+            return 0 <= x < self.cols and 0 <= y < self.rows and y * self.cols + x not in cells
+
+        for _ in range(count):
+            for _ in range(OBSTACLE_ATTEMPTS):
+                x = rng.randrange(left, right)
+                y = rng.randrange(top, bottom)
+                length = 1
+                step = 1
+                if self.difficulty == "Hard" and rng.random() < 0.3:
+                    length = rng.randint(2, 3)
+                    step = 1 if rng.choice(["horizontal", "vertical"]) == "horizontal" else self.cols
+                    if (step == 1 and x + length > right) or (step != 1 and y + length > bottom):
+                        continue
+                piece = [y * self.cols + x + i * step for i in range(length)]
+                if any(cell in cells or cell in self.reserved for cell in piece):
+                    continue
+                if ring_is_connected(piece, self.cols, passable):
+                    cells.update(piece)
+                    break
+        return cells
+
+    # Answered from the chunks that overlap the rect, so the cost follows the
+    # rect size and not the world or the snake length
+    def visible(self, left, top, right, bottom):
+        grid = self.grid
+        for cy in range(top // CHUNK, (bottom - 1) // CHUNK + 1):
+            for cx in range(left // CHUNK, (right - 1) // CHUNK + 1):
+                key = (cx, cy)
+                for value, cells in ((OBSTACLE, grid.obstacle_chunk(key)), (SNAKE, grid.body.get(key, ()))):
+                    for index in cells:
+                        x = index % self.cols
+                        y = index // self.cols
+                        if left <= x < right and top <= y < bottom:
+                            yield x, y, value
+
+def parse_world(text):
+    cols, rows = (int(n) for n in text.lower().split("x"))
+    if cols < Config.GRID_COLS or rows < Config.GRID_ROWS:
+        raise ValueError(f"A world must be at least {Config.GRID_COLS}x{Config.GRID_ROWS}")
+    if cols > MAX_WORLD_SIDE or rows > MAX_WORLD_SIDE:
+        raise ValueError(f"A world can be at most {MAX_WORLD_SIDE}x{MAX_WORLD_SIDE}")
+    return cols, rows